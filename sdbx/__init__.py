@@ -1,3 +1,4 @@
+import os
 from importlib.metadata import version, PackageNotFoundError # setuptools-scm versioning
 try:
     __version__ = version("sdbx")
@@ -11,5 +12,6 @@ logger = logging.getLogger('uvicorn.error')
 from .config import config, source
 if "dev" in __version__: config.development = True
 
-from .server import create_app
-app = create_app()
\ No newline at end of file
+if not os.environ.get("SDBX_WORKER"): # Isolated node workers only need the nodes
+    from .server import create_app
+    app = create_app()
\ No newline at end of file
@@ -0,0 +1,56 @@
+from collections import deque
+from asyncio import Event
+
+class ResultBus:
+    """
+    A task's stream of updates, for any number of subscribers.
+
+    Every message gets a sequence number and the latest `size` messages are kept in a ring buffer,
+    so late joiners replay what they missed. Publishing never waits on subscribers; one that falls
+    further behind than the ring gets a "gap" message and should take a fresh snapshot.
+    """
+    final = ("completed", "error", "cancelled")
+
+    def __init__(self, size: int = 256):
+        self.seq = 0
+        self.ring = deque(maxlen=size)
+        self.closed = False
+        self.changed = Event()
+
+    def publish(self, kind: str, **data) -> dict:
+        if self.closed:
+            return None
+
+        self.seq += 1
+        message = { "seq": self.seq, "type": kind, **data }
+        self.ring.append(message)
+        self.closed = kind in self.final
+
+        # Wake everyone waiting, and give the next round a fresh event
+        changed, self.changed = self.changed, Event()
+        changed.set()
+
+        return message
+
+    async def subscribe(self, since: int = 0):
+        last = since
+
+        while True:
+            if self.ring and self.ring[0]["seq"] > last + 1:
+                # Fell off the back of the ring
+                yield { "seq": self.ring[0]["seq"] - 1, "type": "gap", "missed": self.ring[0]["seq"] - 1 - last }
+                last = self.ring[0]["seq"] - 1
+
+            if last < self.seq:
+                message = self.ring[last - self.ring[0]["seq"] + 1]
+                last = message["seq"]
+                yield message
+
+                if message["type"] in self.final:
+                    return
+                continue
+
+            if self.closed:
+                return
+
+            await self.changed.wait()
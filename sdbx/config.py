@@ -83,6 +83,9 @@ class ConfigModel(BaseModel):
 
 class ExtensionsConfig(ConfigModel):
     disable: Union[bool, Literal['clients', 'nodes']] = False
+    isolate: List[str] = []
+    isolated_workers: int = 2
+    max_tasks_per_child: int = 32
 
 class LocationConfig(ConfigModel):
     clients: str = "clients"
@@ -91,6 +94,8 @@ class LocationConfig(ConfigModel):
     input: str = "input"
     output: str = "output"
     models: str = "models"
+    spill: str = "spill"
+    served: str = "served"
 
 class WebConfig(ConfigModel):
     listen: str = "127.0.0.1"
@@ -102,13 +107,62 @@ class WebConfig(ConfigModel):
     auto_launch: bool = True
     known_models: bool = True
     preview_mode: LatentPreviewMethod = LatentPreviewMethod.AUTO
+    image_format: Literal["png", "webp", "jpeg"] = "png"
+    image_quality: int = 90
+    binary_results: bool = False
+    output_urls: bool = False
 
 class ComputationalConfig(ConfigModel):
     deterministic: bool = False
 
+class ExecutionConfig(ConfigModel):
+    max_concurrent_tasks: int = 1
+    preemption: bool = True
+    max_concurrent_nodes: int = 4
+    stream_buffer: int = 8
+    replay_buffer: int = 256
+    max_cycle_iterations: int = 100
+    cycle_tolerance: float = 1e-6
+    pool: Literal["thread", "process", "none"] = "thread"
+    pool_workers: int = 0
+    incremental: bool = True
+    prune: bool = True
+    merge_duplicates: bool = True
+    max_batch_size: int = 8
+    release_results: bool = True
+    task_history: int = 64
+
+def get_total_memory():
+    try:
+        return os.sysconf('SC_PAGE_SIZE') * os.sysconf('SC_PHYS_PAGES')
+    except (AttributeError, ValueError, OSError):
+        return 8 * 1024 ** 3 # Platform can't tell us (e.g. Windows), assume a modest machine
+
 class MemoryConfig(ConfigModel):
     vram: VRAM = VRAM.NORMAL
     smart_memory: bool = True
+    cache_size: int = 0
+    cache_policy: Literal["lru", "lfu"] = "lru"
+    spill: bool = True
+    spill_watermark: int = 0
+
+    @property
+    def cache_bytes(self):
+        if self.cache_size:
+            return self.cache_size * 1024 ** 2
+
+        # With less VRAM, more of each model lives in system RAM, so leave it more room
+        fraction = {VRAM.HIGH: 0.5, VRAM.NORMAL: 0.4, VRAM.LOW: 0.3, VRAM.NONE: 0.25}[self.vram]
+        if self.smart_memory: # Models get offloaded to DRAM, which the cache also holds on to
+            fraction /= 2
+
+        return int(get_total_memory() * fraction)
+
+    @property
+    def spill_bytes(self):
+        if not self.spill:
+            return 0
+        return self.spill_watermark * 1024 ** 2 if self.spill_watermark else int(get_total_memory() * 0.75)
 
 MixedPrecision = Union[Literal[Precision.MIXED, Precision.FP32, Precision.FP16, Precision.BF16]]
 EncoderPrecision = Union[Literal[Precision.FP32, Precision.FP16, Precision.BF16, Precision.FP8E4M3FN, Precision.FP8E5M2]]
@@ -136,6 +190,7 @@ class Config(BaseSettings):
     location: LocationConfig = Field(default_factory=LocationConfig)
     web: WebConfig = Field(default_factory=WebConfig)
     computational: ComputationalConfig = Field(default_factory=ComputationalConfig)
+    execution: ExecutionConfig = Field(default_factory=ExecutionConfig)
     memory: MemoryConfig = Field(default_factory=MemoryConfig)
     precision: PrecisionConfig = Field(default_factory=PrecisionConfig)
     distributed: DistributedConfig = Field(default_factory=DistributedConfig)
@@ -245,6 +300,11 @@ class Config(BaseSettings):
         from sdbx.executor import Executor
         return Executor(self.node_manager)
 
+    @cached_property
+    def scheduler(self):
+        from sdbx.jobs import JobScheduler
+        return JobScheduler(self.executor)
+
 
 def parse() -> Config:
     parser = argparse.ArgumentParser(add_help=False)
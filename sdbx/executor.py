@@ -1,34 +1,148 @@
+import time
 import inspect
 import logging
 import json
 import contextvars
 
+from array import array
 from itertools import tee
 from typing import Any, Dict
-from functools import partial
-from collections import defaultdict
+from functools import partial, cached_property
 from contextlib import contextmanager
-from asyncio import Queue, Event, create_task, gather
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+from asyncio import Queue, Event, Semaphore, create_task, gather, wait, to_thread, get_running_loop, FIRST_COMPLETED
 
-import networkx as nx
 from networkx import MultiDiGraph
 
 from sdbx import config, logger
-from sdbx.server.types import Edge, Node
+from sdbx.bus import ResultBus
+from sdbx.plan import ExecutionPlan, PlanCache
+from sdbx.profile import TaskProfile, measure, measure_async
+from sdbx.validation import FlowError, FlowValidator
+from sdbx.spill import Results, SpillStore
+from sdbx.isolation import spawn_pool
+from sdbx.nodes.helpers import estimate_size
+from sdbx.server.types import Node
 
 current_context = contextvars.ContextVar('current_context')
 
+exhausted = object() # Sentinel for a finished generator or stream
+
+def close(old, new, tolerance: float) -> bool:
+    # Whether a result stopped changing, within tolerance for numbers, tensors and arrays
+    if old is None or new is None:
+        return old is new
+    if isinstance(old, (tuple, list)) and isinstance(new, (tuple, list)):
+        return len(old) == len(new) and all(close(a, b, tolerance) for a, b in zip(old, new))
+    if hasattr(new, "allclose") and hasattr(new, "shape"): # torch.Tensor
+        return getattr(old, "shape", None) == new.shape and bool(new.allclose(old, rtol=0, atol=tolerance))
+    if hasattr(new, "shape") and hasattr(new, "dtype"): # numpy.ndarray
+        import numpy as np
+        return np.shape(old) == new.shape and bool(np.allclose(old, new, rtol=0, atol=tolerance))
+    if isinstance(old, (int, float)) and isinstance(new, (int, float)):
+        return abs(new - old) <= tolerance
+
+    try:
+        return bool(old == new)
+    except Exception: # Ambiguous comparisons
+        return old is new
+
+def collate(fn, calls: list) -> dict:
+    # Arguments for one call of a batchable node: a list per argument, one value per item, defaults filling the gaps
+    parameters = inspect.signature(fn).parameters
+    return {
+        key: [call[key] if key in call else parameter.default for call in calls]
+        for key, parameter in parameters.items()
+        if parameter.default is not inspect.Parameter.empty or any(key in call for call in calls)
+    }
+
+class EdgeBuffer(Queue):
+    """
+    Bounded buffer carrying a streaming node's results along one edge.
+    """
+    def __init__(self, maxsize: int = 0):
+        super().__init__(maxsize)
+        self.closed = False
+
+    async def send(self, item):
+        if not self.closed:
+            await self.put(item)
+
+    def close(self):
+        # The consumer is done; drop what's left so a waiting producer can move on
+        self.closed = True
+        while not self.empty():
+            self.get_nowait()
+
 class TaskContext:
-    def __init__(self):
+    def __init__(self, max_concurrency: int = None):
         self.queue = Queue()
-        self.results = defaultdict()
+        self.semaphore = Semaphore(max(1, max_concurrency or config.execution.max_concurrent_nodes))
+        self.results = Results()
+        self.kept = Results() # Released results, kept for the next run of the flow to reuse (and first to be spilled)
+        self.remaining = None # Unsatisfied input edges per plan node
+        self.signatures = {} # Node id -> hash of everything its result depends on
+        self.previous = None # Last completed run of the same flow
+        self.reused = set() # Nodes whose results were carried over from the previous run
+        self.buffers = {} # Edge -> EdgeBuffer, for edges out of streaming nodes
+        self.profile = None # TaskProfile, once the flow is compiled
+        self.pruned = [] # Nodes skipped for not reaching a display or terminal node
+        self.merged = {} # Node -> identical node that runs in its place
+        self.finished = {} # Node that others merged into -> Event set once it has results
+        self.consumers = None # Consumers yet to finish per plan node, when results are released early
+        self.bus = ResultBus(config.execution.replay_buffer)
+        self.validated = False # Checked on submission already, like the variants of a batch
+        self.versions = {} # Node -> seq of the bus message announcing its latest result
         self.halt_event = Event()
-        self.result_event = Event()
         self.error_event = Event()
-        self.process_event = Event()
         self.completion_event = Event()
         self.task_error: Exception = None
         self.running_task = None
+        self._state = "queued"
+        self.resume_event = Event()
+        self.resume_event.set()
+
+    @property
+    def state(self):
+        # queued | running | paused | completed | failed | cancelled
+        return self._state
+
+    @state.setter
+    def state(self, state):
+        if self._state in ("completed", "failed", "cancelled"):
+            return # Final
+        if state != self._state:
+            self._state = state
+            self.bus.publish("state", state=state)
+
+    def dict(self):
+        # State and per-node progress, for polling clients
+        nodes = {
+            node: {
+                "version": self.versions.get(node), # seq of its latest result, if it has one
+                "calls": profile.calls,
+                "yields": profile.yields,
+                "reused": profile.reused,
+                "merged": profile.merged,
+            }
+            for node, profile in (self.profile.nodes.items() if self.profile else ()) if node not in self.pruned
+        }
+        return {
+            "state": self.state,
+            "seq": self.bus.seq,
+            "progress": { "nodes": len(nodes), "done": sum(n["version"] is not None for n in nodes.values()) },
+            "nodes": nodes,
+            "pruned": self.pruned,
+            "error": str(self.task_error) if self.task_error else None,
+        }
+
+    def carried(self, node: str):
+        # A result of this run for the next one to reuse, released or not
+        return self.results[node] if node in self.results else self.kept[node]
+
+    async def checkpoint(self):
+        # A safe point between nodes and generator steps; a paused task waits here until resumed
+        await self.resume_event.wait()
 
     @contextmanager
     def use(self):
@@ -46,114 +160,443 @@ class Executor:
     def __init__(self, node_manager):
         self.node_manager = node_manager
         self.tasks = {}
+        self.plans = PlanCache()
+        self.validator = FlowValidator(node_manager, self.plans.size)
+        self.flows = {} # Flow key -> context of its last completed run
+
+    @cached_property
+    def generators(self):
+        return frozenset(fname for fname, fn in self.node_manager.registry.items() if fn.generator)
+
+    @cached_property
+    def spills(self):
+        if not config.memory.spill:
+            return None
+        cache = getattr(self.node_manager, "result_cache", None) # Cached node results hold on to what gets spilled
+        return SpillStore(caches=[cache] if cache is not None else [])
+
+    @cached_property
+    def sinks(self):
+        # Nodes worth running a flow for: their output is shown, or they act on the outside world
+        return frozenset(fname for fname, fn in self.node_manager.registry.items() if fn.info.display or fn.info.terminal)
+
+    @cached_property
+    def batchable(self):
+        return frozenset(fname for fname, fn in self.node_manager.registry.items() if fn.info.batchable)
+
+    def compile(self, graph: MultiDiGraph) -> ExecutionPlan:
+        return self.plans.compile(graph, self.generators, self.sinks if config.execution.prune else frozenset(), self.batchable)
+
+    @cached_property
+    def pool(self):
+        workers = config.execution.pool_workers or None
+
+        if config.execution.pool == "thread":
+            return ThreadPoolExecutor(workers, thread_name_prefix="sdbx-node")
+        elif config.execution.pool == "process":
+            return spawn_pool(workers)
+        
+        return None # Run on the event loop
+
+    async def run_blocking(self, fn, *args):
+        # Dispatch a blocking call to the worker pool so the server loop stays free
+        if self.pool is None:
+            return fn(*args)
+
+        if isinstance(self.pool, ThreadPoolExecutor):
+            # Threads share our memory, so carry the task context along
+            fn = partial(contextvars.copy_context().run, fn)
+
+        return await get_running_loop().run_in_executor(self.pool, fn, *args)
+
+    def dispatch(self, nf):
+        # What to call for a node, and how to get the call off the loop
+        if nf.asynchronous:
+            return nf, None # Awaited on the loop
+        if not isinstance(self.pool, ProcessPoolExecutor):
+            return nf, self.run_blocking
+        if getattr(nf, 'isolated', False):
+            return nf, to_thread # Already runs in a worker of its own, and its stand-in can't be pickled
+        return getattr(nf, '__wrapped__', nf), self.run_blocking # The cache wrapper can't be pickled, and its cache would stay in the worker anyway
     
-    async def execute_node(self, node_id: str, node: Node, inputs: Dict[str, Any]):
+    async def execute_node(self, node_id: str, node: Node, inputs: Dict[str, Any], emit):
         context = TaskContext.get_current()
 
         fname = node['fname']
-        widget_inputs = node['widget_inputs']
+        widget_inputs = { k: v for k, v in node['widget_inputs'].items() if k not in inputs } # Connected inputs win; widget values seed a cycle's feedback
 
         nf = self.node_manager.registry[fname] # Node function
-        lf = partial(nf, **inputs, **widget_inputs) # Loaded function
 
-        async def send_result(result):
-            context.results[node_id] = result if isinstance(result, tuple) else (result,) # Ensure the output is iterable if isn't already
-            context.result_event.set()
+        profile = context.profile.nodes[node_id]
+        profile.calls += 1
+
+        if nf.generator and nf.asynchronous:
+            g = nf(**inputs, **widget_inputs)
 
-            await context.process_event.wait()
-            context.process_event.clear()
+            # Waiting on an async generator takes no thread, so it doesn't count against the task's concurrency either
+            while True:
+                requested = time.perf_counter()
+                result, measurement = await measure_async(anext(g, exhausted))
+                profile.record(requested, measurement)
+                if result is exhausted:
+                    break
 
-            context.result_event.clear()
+                profile.yields += 1
 
-        g = lf()
+                await emit(result)
+                await context.checkpoint()
+        elif nf.generator:
+            g = nf(**inputs, **widget_inputs) # Creating the generator doesn't run its body
 
-        if nf.generator:
-            for result in g:
-                await send_result(result)
+            # Step the body in the pool one yield at a time; generators can't be sent to another process
+            step = to_thread if isinstance(self.pool, ProcessPoolExecutor) else self.run_blocking
+
+            while True:
+                requested = time.perf_counter()
+                async with context.semaphore:
+                    result, measurement = await step(measure, next, g, exhausted)
+                profile.record(requested, measurement)
+                if result is exhausted:
+                    break
+
+                profile.yields += 1
+
+                await emit(result)
+                await context.checkpoint()
         else:
-            await send_result(g)
+            nf, run = self.dispatch(nf)
+
+            if nf.info.batchable:
+                lf = partial(nf, **collate(nf, [{ **inputs, **widget_inputs }])) # A batch of one
+            else:
+                lf = partial(nf, **inputs, **widget_inputs) # Loaded function
+
+            requested = time.perf_counter()
+            if nf.asynchronous:
+                result, measurement = await measure_async(lf())
+            else:
+                # Limited to the task's concurrency
+                async with context.semaphore:
+                    result, measurement = await run(measure, lf)
+            profile.record(requested, measurement)
+            await emit(result[0] if nf.info.batchable else result)
+
+    async def execute_batch(self, graph: MultiDiGraph, plan: ExecutionPlan, batch: list):
+        # One call of a batchable node for several of its copies, split back per copy
+        context = TaskContext.get_current()
+
+        fname = plan.fnames[batch[0]]
+        nf = self.node_manager.registry[fname]
+        calls = [
+            {
+                **graph.nodes[plan.ids[i]]['widget_inputs'],
+                **{ target_handle: context.results[source][source_handle] for target_handle, source, source_handle in plan.inputs[i] }, # Connected inputs win, as in execute_node
+            }
+            for i in batch
+        ]
+        nf, run = self.dispatch(nf)
+        lf = partial(nf, **collate(nf, calls))
+
+        requested = time.perf_counter()
+        if nf.asynchronous:
+            results, measurement = await measure_async(lf())
+        else:
+            async with context.semaphore:
+                results, measurement = await run(measure, lf)
+
+        if len(results) != len(batch):
+            raise ValueError(f"Batchable node {fname} returned {len(results)} results for a batch of {len(batch)}")
+
+        # The call is profiled once, on the first copy
+        context.profile.nodes[plan.ids[batch[0]]].record(requested, measurement)
+        for i, result in zip(batch, results):
+            profile = context.profile.nodes[plan.ids[i]]
+            profile.calls += 1
+            profile.batched = len(batch)
+            self.store(plan.ids[i], result)
     
-    async def process_node(self, graph, node):
+    def satisfy(self, plan: ExecutionPlan, e: int):
+        # Each edge satisfies one input; enqueue the unit it feeds once all of its inputs are satisfied
+        context = TaskContext.get_current()
+        target = plan.unit_of[plan.edge_targets[e]]
+        context.remaining[target] -= 1
+        if context.remaining[target] == 0:
+            context.queue.put_nowait(target)
+
+    def store(self, node: str, result):
+        context = TaskContext.get_current()
+        result = context.results[node] = result if isinstance(result, tuple) else (result,) # Ensure the output is iterable if isn't already
+        profile = context.profile.nodes[node]
+        profile.output_size = max(profile.output_size, estimate_size(result))
+        message = context.bus.publish("result", node=node) # Subscribers catch up whenever they get to it
+        if message:
+            context.versions[node] = message["seq"]
+
+        if self.spills:
+            self.spills.check(self.tasks.values())
+        return result
+
+    def release(self, plan: ExecutionPlan, i: int):
+        # Node i is done with its inputs; drop the results nobody else is going to read
+        context = TaskContext.get_current()
+        for e in plan.incoming(i):
+            context.buffers.pop(e, None)
+            if plan.unit_of[plan.edge_sources[e]] != plan.unit_of[i]:
+                self.unref(plan, plan.edge_sources[e])
+
+    def unref(self, plan: ExecutionPlan, i: int):
+        context = TaskContext.get_current()
+        if context.consumers is None:
+            return
+
+        context.consumers[i] -= 1
+        if context.consumers[i] == 0 and plan.fnames[i] not in self.sinks and plan.unit_outgoing(plan.unit_of[i]):
+            # Display and terminal nodes, and the flow's leaves, keep their outputs for the client
+            result = dict.pop(context.results, plan.ids[i], None) # As it is, spilled or not
+            if result is not None and config.execution.incremental:
+                dict.__setitem__(context.kept, plan.ids[i], result)
+
+    def reusable(self, node: str) -> bool:
+        # Nothing this node depends on changed since the last run
+        context = TaskContext.get_current()
+        previous = context.previous
+        signature = context.signatures.get(node)
+        return (
+            previous is not None and signature is not None and previous.signatures.get(node) == signature
+            and (node in previous.results or node in previous.kept)
+        )
+
+    async def process_unit(self, graph: MultiDiGraph, plan: ExecutionPlan, u: int):
+        if plan.cyclic[u]:
+            await self.process_cycle(graph, plan, u)
+        elif plan.batched[u]:
+            await self.process_batch(graph, plan, u)
+        else:
+            await self.process_node(graph, plan, plan.units[u][0])
+
+    def duplicates(self, plan: ExecutionPlan, signatures: dict) -> dict:
+        # Nodes computing exactly what an earlier node does (same function, settings and inputs), mapped to that node.
+        # Streams, cycles and terminal nodes, which run for their side effects, always run on their own
+        first = {}
+        merged = {}
+        for i in plan.order:
+            node = plan.ids[i]
+            if plan.node_streams[i] or plan.cyclic[plan.unit_of[i]] or self.node_manager.registry[plan.fnames[i]].info.terminal:
+                continue
+
+            canonical = first.setdefault(signatures[node], node)
+            if canonical != node:
+                merged[node] = canonical
+        return merged
+
+    async def process_node(self, graph: MultiDiGraph, plan: ExecutionPlan, i: int):
         context = TaskContext.get_current()
+        node = plan.ids[i]
 
-        # Get data of all input edges
-        in_edge_data = [Edge(
-            source=e[0],
-            **v,
-        ) for e in graph.in_edges(node) for v in graph.get_edge_data(*e).values()]
+        if node in context.merged:
+            # Share the results of the identical node instead of running again
+            canonical = context.merged[node]
+            await context.finished[canonical].wait()
+            self.store(node, context.results[canonical])
+            context.profile.nodes[node].merged = canonical
+            for e in plan.outgoing(i):
+                self.satisfy(plan, e)
+            self.unref(plan, plan.index[canonical])
+            self.release(plan, i)
+            return
 
         # Gather inputs from predecessors
         # P.S. Do you see why we had to make the output iterable? :)
-        inputs = { v.target_handle: context.results[v.source][v.source_handle] for v in in_edge_data }
-        
-        # Execute the node with the collected inputs
-        await self.execute_node(node, graph.nodes[node], inputs)
-        
-        # Enqueue successors if they have received all their inputs
-        for successor in graph.successors(node):
-            if len(context.results[node]) == len(list(graph.predecessors(successor))):
-                await context.queue.put(successor)
-    
-    def detect_cycles(self, graph):
-        # Detect strongly connected components (SCCs)
-        sccs = list(nx.strongly_connected_components(graph))
-        
-        # Filter out SCCs that are trivial (single node with no self-loop)
-        cycles = [scc for scc in sccs if len(scc) > 1 or graph.has_edge(list(scc)[0], list(scc)[0])]
-        
-        return cycles
-    
-    async def handle_cycle(self, graph, cycle):
+        inputs = { target_handle: context.results[source][source_handle] for target_handle, source, source_handle in plan.inputs[i] }
+
+        # A streaming node opens its outgoing buffers up front, so consumers start as soon as it does
+        outputs = []
+        for e in plan.outgoing(i):
+            if plan.edge_streams[e]:
+                outputs.append(context.buffers.setdefault(e, EdgeBuffer(config.execution.stream_buffer)))
+                self.satisfy(plan, e)
+
+        async def emit(result):
+            result = self.store(node, result)
+
+            # Backpressure comes from consumers: wait while any of their buffers is full
+            for buffer in outputs:
+                await buffer.send(result)
+
+        if not plan.node_streams[i] and self.reusable(node):
+            # Reuse the result of the last run. Only a stream's last item is kept, so streaming nodes always run again
+            await emit(context.previous.carried(node))
+            context.reused.add(node)
+            context.profile.nodes[node].reused = True
+        elif not plan.stream_inputs[i]:
+            await context.checkpoint()
+            await self.execute_node(node, graph.nodes[node], inputs, emit)
+        else:
+            # Run once per item of the incoming streams, taken in lockstep
+            streams = [(context.buffers[e], target_handle, source_handle) for e, target_handle, source_handle in plan.stream_inputs[i]]
+            try:
+                while True:
+                    items = [await buffer.get() for buffer, _, _ in streams]
+                    if any(item is exhausted for item in items):
+                        break
+
+                    await context.checkpoint()
+                    streamed = { target_handle: item[source_handle] for (_, target_handle, source_handle), item in zip(streams, items) }
+                    await self.execute_node(node, graph.nodes[node], { **inputs, **streamed }, emit)
+            finally:
+                for buffer, _, _ in streams:
+                    buffer.close() # Unblock producers of streams that outlast the shortest one
+
+        for buffer in outputs:
+            await buffer.send(exhausted)
+        for e in plan.outgoing(i):
+            if not plan.edge_streams[e]:
+                self.satisfy(plan, e)
+        if node in context.finished:
+            context.finished[node].set()
+        self.release(plan, i)
+
+    async def process_batch(self, graph: MultiDiGraph, plan: ExecutionPlan, u: int):
         context = TaskContext.get_current()
+        members = plan.units[u]
 
-        # Process the cycle as a strongly connected component (SCC)
-        subgraph = graph.subgraph(cycle)
-        
-        # Initialize node outputs
-        for node in cycle:
-            if node not in context.results:
-                await self.execute_node(graph.nodes[node], [])
-        
-        # Iterate to propagate the feedback until halted
-        while not context.halt_event.is_set():
-            converged = True
-            for node in cycle:
-                inputs = [context.results[pred][-1] for pred in subgraph.predecessors(node)]
-                output = await self.execute_node(graph.nodes[node], inputs)
-                
-                if not context.results[node] or output != context.results[node][-1]:
-                    converged = False
-                
-                context.results[node] = output
-                context.results.set()
-            
-            # If convergence is achieved or no change in results, break the loop
-            if converged:
-                break
+        if any(plan.stream_inputs[i] for i in members):
+            # Streamed items arrive one at a time, so there's nothing to collate
+            await gather(*(self.process_node(graph, plan, i) for i in members))
+            return
+
+        # Copies merged into another node or reused from the last run go the usual way, after the batch they may be waiting on
+        fresh = [i for i in members if plan.ids[i] not in context.merged and not self.reusable(plan.ids[i])]
+        others = [i for i in members if i not in fresh]
+
+        size = max(1, config.execution.max_batch_size)
+        for start in range(0, len(fresh), size):
+            await context.checkpoint()
+            await self.execute_batch(graph, plan, fresh[start:start + size])
+
+        for i in fresh:
+            if plan.ids[i] in context.finished:
+                context.finished[plan.ids[i]].set()
+            for e in plan.outgoing(i):
+                self.satisfy(plan, e)
+            self.release(plan, i)
+
+        for i in others:
+            await self.process_node(graph, plan, i)
+
+    async def process_cycle(self, graph: MultiDiGraph, plan: ExecutionPlan, u: int):
+        context = TaskContext.get_current()
+        members = [(i, plan.ids[i]) for i in plan.units[u]]
+
+        async def emit(node, result):
+            self.store(node, result)
+
+        if all(self.reusable(node) for _, node in members):
+            for _, node in members:
+                self.store(node, context.previous.carried(node))
+                context.reused.add(node)
+                context.profile.nodes[node].reused = True
+        else:
+            # Feed results around the cycle until a full pass changes nothing
+            iterations = config.execution.max_cycle_iterations
+            for iteration in range(iterations):
+                converged = iteration > 0
+                for i, node in members:
+                    # Feedback not produced yet (on the first pass) falls back to the node's widget values, then its defaults
+                    inputs = {
+                        target_handle: context.results[source][source_handle]
+                        for target_handle, source, source_handle in plan.inputs[i] if source in context.results
+                    }
+                    last = context.results.get(node)
+
+                    await context.checkpoint()
+                    await self.execute_node(node, graph.nodes[node], inputs, partial(emit, node))
+
+                    converged = converged and close(last, context.results.get(node), config.execution.cycle_tolerance)
+
+                if converged:
+                    break
+            else:
+                logger.warning(f"Cycle {[node for _, node in members]} did not converge in {iterations} iterations")
+
+        for e in plan.unit_outgoing(u):
+            self.satisfy(plan, e)
+        for i, _ in members:
+            self.release(plan, i)
 
     async def execute_graph(self, graph: MultiDiGraph):
         context = TaskContext.get_current()
 
+        running = set()
+        ready = None # Pending wait for the next unit to become ready
+        context.state = "running"
+
         try:
-            # Detect cycles in the graph
-            cycles = self.detect_cycles(graph)
-            
-            # Setup cycle coroutines
-            ct = [self.handle_cycle(graph, cycle) for cycle in cycles]
-            
-            # Initialize the queue with nodes that have no predecessors (input terminal nodes)
-            for node in graph.nodes:
-                if graph.in_degree(node) == 0:
-                    await context.queue.put(node)
-
-            # Process nodes in topological order (acyclic parts)
-            while not context.queue.empty() and not context.halt_event.is_set():
-                node = await context.queue.get()
-                await self.process_node(graph, node)
-            
-            # Wait for cycle handling coroutines to complete
-            await gather(*ct)
+            plan = self.compile(graph)
+
+            errors = [] if context.validated else self.validator.check(graph, plan)
+            if errors:
+                raise FlowError(errors)
 
+            context.pruned = plan.pruned
+            if plan.pruned:
+                logger.info(f"Skipping nodes that don't reach a display or terminal node: {plan.pruned}")
+            context.profile = TaskProfile(plan.ids, plan.fnames)
+
+            flow = graph.graph.get("flow") or plan.key
+            if config.execution.incremental or config.execution.merge_duplicates:
+                context.signatures = plan.signatures(graph)
+            if config.execution.incremental:
+                context.previous = self.flows.get(flow)
+            if config.execution.merge_duplicates:
+                context.merged = self.duplicates(plan, context.signatures)
+                context.finished = { canonical: Event() for canonical in context.merged.values() }
+            if config.execution.release_results:
+                # Results are read once per edge into another unit, and once per node merged into them
+                context.consumers = array('l', [0] * len(plan))
+                for s, t in zip(plan.edge_sources, plan.edge_targets):
+                    if plan.unit_of[s] != plan.unit_of[t]:
+                        context.consumers[s] += 1
+                for canonical in context.merged.values():
+                    context.consumers[plan.index[canonical]] += 1
+
+            # Initialize the queue with units that have no predecessors (input terminal nodes and self-contained cycles)
+            context.remaining = array('l', plan.in_degree)
+            for u in plan.roots:
+                context.queue.put_nowait(u)
+
+            # Process units in topological order, starting each one as soon as it is ready. Units can become ready
+            # while others are still running (consumers of a stream start with their producer), so the queue is waited on too
+            while not context.halt_event.is_set():
+                while not context.queue.empty():
+                    running.add(create_task(self.process_unit(graph, plan, context.queue.get_nowait())))
+
+                if not running:
+                    break
+
+                ready = ready or create_task(context.queue.get())
+                done, _ = await wait(running | { ready }, return_when=FIRST_COMPLETED)
+                if ready in done:
+                    running.add(create_task(self.process_unit(graph, plan, ready.result())))
+                    ready = None
+                for task in done & running:
+                    running.discard(task)
+                    task.result() # Propagate node errors
+
+            if context.halt_event.is_set():
+                return context.results
+
+            context.previous = None
+            if config.execution.incremental:
+                replaced = self.flows.pop(flow, None)
+                if replaced is not None:
+                    replaced.kept.clear() # Only the latest run is reused
+                self.flows[flow] = context
+                if len(self.flows) > self.plans.size:
+                    self.flows.pop(next(iter(self.flows))).kept.clear() # Forget the least recently run flow
+
+            context.state = "completed"
+            context.bus.publish("completed")
             context.completion_event.set() # Completed execution successfully
             
             return context.results
@@ -161,17 +604,41 @@ class Executor:
             # Capture the error and signal it via error_event
             logger.exception(e)
             context.task_error = e
+            context.state = "failed"
+            context.bus.publish("error", error=str(e))
             context.error_event.set()
+        finally:
+            # Stop any branches still in flight (on error or halt)
+            for task in running:
+                task.cancel()
+            if ready is not None:
+                ready.cancel()
+            self.retire()
+
+    def retire(self):
+        # Forget the oldest finished tasks beyond the history limit
+        finished = [tid for tid, context in self.tasks.items() if context.bus.closed]
+        for tid in finished[:max(0, len(finished) - config.execution.task_history)]:
+            del self.tasks[tid]
     
-    def execute(self, graph: MultiDiGraph, task_id: str):
-        context = TaskContext()
-        self.tasks[task_id] = context
+    def create_context(self, task_id: str, max_concurrency: int = None) -> TaskContext:
+        context = self.tasks[task_id] = TaskContext(max_concurrency)
+        return context
+
+    def run(self, graph: MultiDiGraph, context: TaskContext):
         with context.use():
             context.running_task = create_task(self.execute_graph(graph))
+        return context.running_task
+
+    def execute(self, graph: MultiDiGraph, task_id: str, max_concurrency: int = None):
+        return self.run(graph, self.create_context(task_id, max_concurrency))
     
     def halt(self, task_id: str):
         context = self.tasks.get(task_id)
-        if context:
+        if context and not context.bus.closed:
+            context.state = "cancelled"
+            context.bus.publish("cancelled")
             context.halt_event.set()
+            context.resume_event.set() # Let a paused task reach its cancellation
             if context.running_task:
                 context.running_task.cancel()
\ No newline at end of file
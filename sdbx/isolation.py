@@ -0,0 +1,164 @@
+import os
+import asyncio
+import inspect
+import weakref
+import importlib
+import multiprocessing
+
+from functools import wraps
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import resource_tracker
+from multiprocessing.shared_memory import SharedMemory
+
+from sdbx import config, logger
+
+class Shared:
+    """
+    A tensor or array handed to another process through a shared memory block instead of being pickled.
+    Whoever receives it unlinks the block; the memory lives on while their array does.
+    """
+    def __init__(self, name: str, dtype: str, shape: tuple, torch: bool):
+        self.name = name
+        self.dtype = dtype
+        self.shape = shape
+        self.torch = torch
+
+def share(value):
+    # Swap tensors and arrays, also inside tuples, lists and dicts, for shared memory blocks
+    if isinstance(value, tuple):
+        return tuple(share(v) for v in value)
+    if isinstance(value, list):
+        return [share(v) for v in value]
+    if isinstance(value, dict):
+        return { k: share(v) for k, v in value.items() }
+
+    if os.name != "posix": # Named blocks vanish with their last handle elsewhere, so they'd be gone before the other side attaches
+        return value
+
+    torch = hasattr(value, "element_size") and hasattr(value, "numpy") # torch.Tensor
+    if torch and value.device.type != "cpu":
+        return value
+    if not torch and not hasattr(value, "__array_interface__"): # numpy.ndarray
+        return value
+
+    try:
+        import numpy as np
+        array = np.asarray(value.detach().numpy() if torch else value)
+    except TypeError: # No numpy equivalent, like bfloat16
+        return value
+    if array.nbytes == 0 or array.dtype.hasobject:
+        return value
+
+    block = SharedMemory(create=True, size=array.nbytes)
+    np.ndarray(array.shape, array.dtype, buffer=block.buf)[...] = array
+    resource_tracker.unregister(block._name, "shared_memory") # Ours to hand over, not to clean up when this process exits
+    block.close()
+
+    return Shared(block.name, array.dtype.str, array.shape, torch)
+
+def unshare(value):
+    if isinstance(value, tuple):
+        return tuple(unshare(v) for v in value)
+    if isinstance(value, list):
+        return [unshare(v) for v in value]
+    if isinstance(value, dict):
+        return { k: unshare(v) for k, v in value.items() }
+    if not isinstance(value, Shared):
+        return value
+
+    import numpy as np
+    block = SharedMemory(value.name)
+    block.unlink() # The mapping outlives the name
+    array = np.ndarray(value.shape, np.dtype(value.dtype), buffer=block.buf)
+    weakref.finalize(array, block.close)
+
+    if value.torch:
+        import torch
+        return torch.from_numpy(array)
+    return array
+
+def discard(value):
+    # Unlink blocks that never reached the other side
+    if isinstance(value, (tuple, list)):
+        for v in value:
+            discard(v)
+    elif isinstance(value, dict):
+        for v in value.values():
+            discard(v)
+    elif isinstance(value, Shared):
+        try:
+            block = SharedMemory(value.name)
+            block.close()
+            block.unlink()
+        except FileNotFoundError:
+            pass
+
+def run(module: str, name: str, kwargs: dict, generator: bool):
+    # Runs in the isolated worker
+    fn = getattr(importlib.import_module(module), name)
+    result = fn(**unshare(kwargs))
+
+    if inspect.isasyncgen(result):
+        result = asyncio.run(collect(result))
+    elif inspect.isawaitable(result):
+        result = asyncio.run(result)
+    return share(list(result) if generator else result)
+
+async def collect(generator):
+    return [item async for item in generator]
+
+def spawn_pool(workers: int = None, python: str = None, max_tasks: int = None) -> ProcessPoolExecutor:
+    # Worker processes that are fresh interpreters, never forks of the server with its loop and threads
+    context = multiprocessing.get_context("spawn")
+    if python:
+        context.set_executable(python)
+
+    # Spawning re-imports the server's main module, and with it sdbx, before any initializer could run,
+    # so the flag that keeps workers from starting the server app has to come with their environment
+    os.environ["SDBX_WORKER"] = "1"
+    return ProcessPoolExecutor(workers, mp_context=context, max_tasks_per_child=max_tasks)
+
+class IsolatedPool:
+    """
+    Worker processes for nodes of untrusted or heavy modules, started with the node environment's python.
+
+    Workers are recycled after `max_tasks` calls to cap leaks. Tensors and arrays travel both ways through
+    shared memory. Generator nodes run to completion in the worker, then replay their items.
+    """
+    def __init__(self, python: str = None, workers: int = None, max_tasks: int = None, executor=None):
+        self.python = python
+        self.workers = workers or config.extensions.isolated_workers
+        self.max_tasks = max_tasks or config.extensions.max_tasks_per_child
+        self._executor = executor
+
+    @property
+    def executor(self):
+        if self._executor is None:
+            self._executor = spawn_pool(self.workers, self.python, self.max_tasks)
+            logger.info(f"Started {self.workers} isolated node workers")
+
+        return self._executor
+
+    def call(self, node, kwargs: dict):
+        shared = share(kwargs)
+        try:
+            result = self.executor.submit(run, node.__module__, node.__name__, shared, node.generator).result()
+        except BaseException:
+            discard(shared)
+            raise
+        return unshare(result)
+
+    def wrap(self, node):
+        # Stand-in for the node, with the same name and info, that runs it in a worker
+        if node.generator:
+            @wraps(node)
+            def isolated(**kwargs):
+                yield from self.call(node, kwargs) # Nothing runs until the first item is asked for
+        else:
+            @wraps(node)
+            def isolated(**kwargs):
+                return self.call(node, kwargs)
+
+        isolated.isolated = True
+        isolated.asynchronous = False # Async nodes are awaited in the worker, so the stand-in blocks like any other
+        return isolated
@@ -0,0 +1,180 @@
+import itertools
+
+from collections import deque
+
+from networkx import MultiDiGraph
+
+from sdbx import config, logger
+
+class Job:
+    def __init__(self, task_id: str, graph: MultiDiGraph, context, priority: int = 0, client: str = None):
+        self.task_id = task_id
+        self.graph = graph
+        self.context = context
+        self.priority = priority
+        self.client = client
+        self.started = False
+
+    def dict(self):
+        return {
+            "task_id": self.task_id,
+            "priority": self.priority,
+            "client": self.client,
+            "state": self.context.state,
+        }
+
+class JobScheduler:
+    """
+    Server-wide queue in front of the executor.
+
+    Runs at most `max_concurrent` tasks at a time. Waiting jobs are taken by priority (highest first)
+    and round-robin across clients within a priority. With preemption, a waiting job of higher priority
+    pauses the lowest-priority running job at its next safe point (between nodes or generator steps).
+    """
+    def __init__(self, executor, max_concurrent: int = None, preemption: bool = None):
+        self.executor = executor
+        self.max_concurrent = max(1, max_concurrent or config.execution.max_concurrent_tasks)
+        self.preemption = config.execution.preemption if preemption is None else preemption
+
+        self.waiting = {} # priority -> client -> deque of jobs
+        self.served = {} # client -> tick it was last served at
+        self.tick = 0
+        self.running = {} # task_id -> job
+        self.jobs = {} # task_id -> job, until finished
+        self._positions = None
+
+    def submit(self, graph: MultiDiGraph, task_id: str, priority: int = 0, client: str = None, validated: bool = False, max_concurrency: int = None) -> Job:
+        context = self.executor.create_context(task_id, max_concurrency)
+        context.validated = validated
+        job = self.jobs[task_id] = Job(task_id, graph, context, priority, client)
+
+        self.enqueue(job)
+        self.pump()
+
+        return job
+
+    def enqueue(self, job: Job, front: bool = False):
+        jobs = self.waiting.setdefault(job.priority, {}).setdefault(job.client, deque())
+        jobs.appendleft(job) if front else jobs.append(job)
+        self._positions = None
+
+    def take(self):
+        # Highest priority first, then the client that was served longest ago
+        if not self.waiting:
+            return None
+
+        priority = max(self.waiting)
+        clients = self.waiting[priority]
+        client = min(clients, key=lambda c: self.served.get(c, -1))
+
+        job = clients[client].popleft()
+        if not clients[client]:
+            del clients[client]
+        if not clients:
+            del self.waiting[priority]
+
+        self.served[client] = self.tick
+        self.tick += 1
+        self._positions = None
+        return job
+
+    def pump(self):
+        if self.preemption:
+            self.preempt()
+
+        while len(self.running) < self.max_concurrent and (job := self.take()):
+            self.start(job)
+
+    def start(self, job: Job):
+        if job.context.bus.closed:
+            return # Finished while it waited, like a paused job whose last node was already running
+
+        self.running[job.task_id] = job
+        job.context.state = "running"
+
+        if job.started:
+            job.context.resume_event.set() # Resume a preempted job where it paused
+            return
+
+        job.started = True
+        task = self.executor.run(job.graph, job.context)
+        task.add_done_callback(lambda _: self.finish(job))
+
+    def finish(self, job: Job):
+        self.running.pop(job.task_id, None)
+        if job in self.waiting.get(job.priority, {}).get(job.client, ()):
+            self.dequeue(job) # Paused, but done anyway
+        self.jobs.pop(job.task_id, None)
+        job.graph = None
+        self.pump()
+
+    def preempt(self):
+        # Pause the lowest-priority running jobs while more urgent ones wait for a slot
+        while self.waiting and len(self.running) >= self.max_concurrent:
+            top = max(self.waiting)
+            victim = min(self.running.values(), key=lambda j: j.priority)
+            if victim.priority >= top:
+                return
+
+            logger.info(f"Pausing task {victim.task_id} for a priority {top} job")
+            victim.context.resume_event.clear()
+            victim.context.state = "paused"
+            del self.running[victim.task_id]
+            self.enqueue(victim, front=True)
+
+            self.start(self.take())
+
+    def dequeue(self, job: Job):
+        clients = self.waiting[job.priority]
+        clients[job.client].remove(job)
+        if not clients[job.client]:
+            del clients[job.client]
+        if not clients:
+            del self.waiting[job.priority]
+        self._positions = None
+
+    def cancel(self, task_id: str):
+        job = self.jobs.get(task_id)
+        if job and task_id not in self.running:
+            self.dequeue(job)
+            if not job.started:
+                self.jobs.pop(task_id) # Never ran, so nothing else will finish it
+
+        # A started (possibly paused) job unwinds through its task and finishes from there
+        self.executor.halt(task_id)
+
+    def positions(self) -> dict:
+        # Order in which waiting jobs would be started (replaying take()), computed once per queue change
+        if self._positions is None:
+            order = []
+            served = dict(self.served)
+            tick = itertools.count(self.tick)
+
+            for priority in sorted(self.waiting, reverse=True):
+                queues = { client: deque(jobs) for client, jobs in self.waiting[priority].items() }
+                while queues:
+                    client = min(queues, key=lambda c: served.get(c, -1))
+                    order.append(queues[client].popleft())
+                    served[client] = next(tick)
+                    if not queues[client]:
+                        del queues[client]
+
+            self._positions = { job.task_id: n for n, job in enumerate(order, start=1) }
+
+        return self._positions
+
+    def position(self, task_id: str):
+        # 0 when running, None when unknown or finished
+        if task_id in self.running:
+            return 0
+        return self.positions().get(task_id)
+
+    def dict(self):
+        return {
+            "max_concurrent": self.max_concurrent,
+            "running": [job.dict() for job in self.running.values()],
+            "waiting": [
+                { **self.jobs[tid].dict(), "position": position }
+                for tid, position in sorted(self.positions().items(), key=lambda item: item[1])
+            ],
+        }
@@ -2,40 +2,335 @@ import gc
 import io
 import os
 import re
+import sys
 import json
 import base64
 
+import asyncio
+import inspect
 import secrets as secrets
-from functools import cache as function_cache, wraps
+from enum import Enum
+from threading import Lock, RLock
+from functools import wraps
+from collections import OrderedDict
 
 from sdbx.config import config
 
 ### CACHING ###
 
-def generator_cache(func):
-    @wraps(func)
-    def wrapper(*args, **kwargs):
-        # If the cache exists and matches the arguments, return an iterator over the cached results
-        if wrapper.cache and wrapper.cache_args == (args, kwargs):
-            return iter(wrapper.cache)
-
-        # If no cache exists, or arguments differ, create a new generator
-        wrapper.cache = []
-        wrapper.cache_args = (args, kwargs)
-        
-        def generator_with_cache():
-            for result in func(*args, **kwargs):
-                wrapper.cache.append(result)  # Cache the result as it's generated
-                yield result  # Yield the result to the caller
-
-        return generator_with_cache()
-
-    # Initialize cache and arguments
-    wrapper.cache = None
-    wrapper.cache_args = None
-    return wrapper
-
-cache = lambda node: generator_cache(node) if node.generator else function_cache(node)
+def estimate_size(value, seen=None) -> int:
+    # Rough byte footprint of a node result, duck-typed so torch, PIL and diffusers stay optional
+    seen = set() if seen is None else seen
+    if id(value) in seen:
+        return 0
+    seen.add(id(value))
+
+    if hasattr(value, "element_size") and hasattr(value, "nelement"): # torch.Tensor
+        return value.element_size() * value.nelement()
+    if isinstance(getattr(value, "nbytes", None), int): # numpy.ndarray
+        return value.nbytes
+    if hasattr(value, "getbands") and hasattr(value, "size"): # PIL.Image
+        width, height = value.size
+        return width * height * len(value.getbands())
+    if callable(getattr(value, "parameters", None)): # torch.nn.Module
+        tensors = [*value.parameters(), *getattr(value, "buffers", lambda: [])()]
+        return sum(estimate_size(t, seen) for t in tensors)
+    if isinstance(getattr(value, "components", None), dict): # diffusers pipeline
+        return sum(estimate_size(c, seen) for c in value.components.values())
+    if isinstance(value, dict):
+        return sys.getsizeof(value) + sum(estimate_size(v, seen) for v in value.values())
+    if isinstance(value, (tuple, list, set, frozenset)):
+        return sys.getsizeof(value) + sum(estimate_size(v, seen) for v in value)
+
+    return sys.getsizeof(value)
+
+def freeze(value, pins: list):
+    # Hashable stand-in for a node argument. Anything but plain data (tensors, models, images) is keyed
+    # by identity and pinned, so its id can't be reused while the entry lives
+    if value is None or isinstance(value, (str, bytes, int, float, complex, Enum)):
+        return value
+    if isinstance(value, (tuple, list)):
+        return (type(value).__name__, *(freeze(v, pins) for v in value))
+    if isinstance(value, dict):
+        return ("dict", *((freeze(k, pins), freeze(v, pins)) for k, v in value.items()))
+
+    pins.append(value)
+    return ("id", id(value))
+
+class ResultCache:
+    """
+    Node result cache bounded by an estimated byte budget, evicting by LRU or LFU.
+    """
+    def __init__(self, budget: int, policy: str = "lru"):
+        self.budget = budget
+        self.policy = policy
+        self.entries = OrderedDict() # key -> [value, size, uses, pins]
+        self.size = 0
+        self.hits = self.misses = self.evictions = 0
+        self.lock = RLock()
+
+    @classmethod
+    def from_config(cls, memory):
+        return cls(memory.cache_bytes, memory.cache_policy)
+
+    def get(self, key):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return False, None
+
+            self.hits += 1
+            entry[2] += 1
+            self.entries.move_to_end(key)
+            return True, entry[0]
+
+    def put(self, key, value, pins=()):
+        seen = set()
+        size = estimate_size(value, seen) + sum(estimate_size(pin, seen) for pin in pins) # Pinned inputs live as long as the entry
+        if size > self.budget:
+            return # Would evict everything and still not fit
+
+        with self.lock:
+            if key in self.entries:
+                self.size -= self.entries.pop(key)[1]
+
+            while self.entries and self.size + size > self.budget:
+                self.evict()
+
+            self.entries[key] = [value, size, 1, pins]
+            self.size += size
+
+    def forget(self, values):
+        # Drop the entries holding any of these values, as result or pinned input, so they can be freed
+        ids = { id(value) for value in values }
+
+        def holds(value):
+            if id(value) in ids:
+                return True
+            if isinstance(value, (tuple, list)):
+                return any(holds(v) for v in value)
+            if isinstance(value, dict):
+                return any(holds(v) for v in value.values())
+            return False
+
+        with self.lock:
+            for key in [k for k, (value, _, _, pins) in self.entries.items() if holds(value) or holds(pins)]:
+                self.size -= self.entries.pop(key)[1]
+
+    def evict(self):
+        if self.policy == "lfu":
+            key = min(self.entries, key=lambda k: self.entries[k][2]) # Oldest among the least used
+        else:
+            key = next(iter(self.entries))
+
+        self.size -= self.entries.pop(key)[1]
+        self.evictions += 1
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+            self.size = 0
+
+    def stats(self):
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "entries": len(self.entries),
+            "size": self.size,
+            "budget": self.budget,
+            "policy": self.policy,
+        }
+
+    def __call__(self, func):
+        if inspect.iscoroutinefunction(func):
+            @wraps(func)
+            async def wrapper(*args, **kwargs):
+                pins = []
+                key = (func.__module__, func.__qualname__, freeze(args, pins), freeze(sorted(kwargs.items()), pins))
+
+                hit, result = self.get(key)
+                if not hit:
+                    result = await func(*args, **kwargs)
+                    self.put(key, result, pins)
+                return result
+        else:
+            @wraps(func)
+            def wrapper(*args, **kwargs):
+                pins = []
+                key = (func.__module__, func.__qualname__, freeze(args, pins), freeze(sorted(kwargs.items()), pins))
+
+                hit, result = self.get(key)
+                if not hit:
+                    result = func(*args, **kwargs)
+                    self.put(key, result, pins)
+                return result
+
+        wrapper.cache = self
+        return wrapper
+
+class Broadcast:
+    """
+    One run of a generator, produced once and replayed to any number of subscribers.
+    Subscribers first replay what was already produced, then take turns advancing the live producer.
+    """
+    def __init__(self, generator):
+        self.generator = generator
+        self.items = []
+        self.grew = None # Called with each new item's estimated size
+        self.done = False
+        self.error = None
+        self.lock = Lock()
+
+    def append(self, item):
+        self.items.append(item)
+        if self.grew:
+            self.grew(estimate_size(item))
+
+    def advance(self, count):
+        # Produce item number `count` unless another subscriber got there first
+        with self.lock:
+            if len(self.items) > count or self.done:
+                return
+
+            try:
+                self.append(next(self.generator))
+            except StopIteration:
+                self.done = True
+            except Exception as e:
+                self.error = e
+                self.done = True
+
+    def subscribe(self):
+        i = 0
+        while True:
+            if i < len(self.items):
+                yield self.items[i]
+                i += 1
+            elif self.done:
+                if self.error:
+                    raise self.error
+                return
+            else:
+                self.advance(i)
+
+class AsyncBroadcast(Broadcast):
+    """
+    Broadcast of an async generator, advanced on the event loop.
+    """
+    def __init__(self, generator):
+        super().__init__(generator)
+        self.lock = asyncio.Lock()
+
+    async def advance(self, count):
+        async with self.lock:
+            if len(self.items) > count or self.done:
+                return
+
+            try:
+                self.append(await anext(self.generator))
+            except StopAsyncIteration:
+                self.done = True
+            except Exception as e:
+                self.error = e
+                self.done = True
+
+    async def subscribe(self):
+        i = 0
+        while True:
+            if i < len(self.items):
+                yield self.items[i]
+                i += 1
+            elif self.done:
+                if self.error:
+                    raise self.error
+                return
+            else:
+                await self.advance(i)
+
+class GeneratorCache:
+    """
+    Generator node runs keyed by arguments, bounded to the most recently used `size` runs and to an
+    estimated byte budget of their items and pinned inputs. Runs grow as they're produced; an evicted
+    run carries on for its current subscribers, it just isn't replayed to new ones.
+    """
+    def __init__(self, size: int = 32, budget: int = None):
+        self.size = size
+        self.budget = budget
+        self.entries = OrderedDict() # key -> [Broadcast, pins, bytes accounted for]
+        self.bytes = 0
+        self.hits = self.misses = self.evictions = 0
+        self.lock = RLock()
+
+    @classmethod
+    def from_config(cls, memory):
+        return cls(budget=memory.cache_bytes)
+
+    def subscribe(self, key, pins, produce):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None or entry[0].error:
+                self.misses += 1
+                if entry is not None:
+                    self.drop(key)
+
+                generator = produce()
+                broadcast = (AsyncBroadcast if inspect.isasyncgen(generator) else Broadcast)(generator)
+                seen = set()
+                entry = self.entries[key] = [broadcast, pins, sum(estimate_size(pin, seen) for pin in pins)]
+                broadcast.grew = lambda size: self.grew(key, broadcast, size)
+                self.bytes += entry[2]
+                self.shrink()
+            else:
+                self.hits += 1
+                self.entries.move_to_end(key)
+
+        return entry[0].subscribe()
+
+    def grew(self, key, broadcast, size):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is not None and entry[0] is broadcast: # Still cached
+                entry[2] += size
+                self.bytes += size
+                self.shrink()
+
+    def shrink(self):
+        while self.entries and (len(self.entries) > self.size or (self.budget is not None and self.bytes > self.budget)):
+            self.drop(next(iter(self.entries))) # Least recently used, possibly the run that just grew
+            self.evictions += 1
+
+    def drop(self, key):
+        self.bytes -= self.entries.pop(key)[2]
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+            self.bytes = 0
+
+    def stats(self):
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "entries": len(self.entries),
+            "size": self.bytes,
+            "budget": self.budget,
+        }
+
+    def __call__(self, func):
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            pins = []
+            key = (func.__module__, func.__qualname__, freeze(args, pins), freeze(sorted(kwargs.items()), pins))
+            return self.subscribe(key, pins, lambda: func(*args, **kwargs))
+
+        wrapper.cache = self
+        return wrapper
+
+def cache(node, store: ResultCache, streams: GeneratorCache):
+    return streams(node) if node.generator else store(node)
 
 ### NODE INFO NAMING ###
 
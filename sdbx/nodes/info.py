@@ -4,7 +4,7 @@ import inspect
 from pathlib import Path
 from dataclasses import asdict
 from collections import OrderedDict
-from collections.abc import Iterator
+from collections.abc import Iterator, AsyncIterator
 
 from sdbx import logger
 from sdbx.nodes.helpers import format_name, timing
@@ -12,7 +12,7 @@ from sdbx.nodes.types import Slider, Numerical, Text, Validator, Dependent, Name
 
 class NodeInfo:
     @timing(logger.debug)
-    def __init__(self, fn, path=None, name=None, display=False):
+    def __init__(self, fn, path=None, name=None, display=False, batchable=False):
         self.fname = getattr(fn, '__name__')
 
         if path:
@@ -22,17 +22,22 @@ class NodeInfo:
         self.path = path or Path(inspect.getfile(fn)).stem
 
         self.display = display
+        self.terminal = False # Nothing comes out, so it runs for its side effects
+        self.batchable = batchable
 
         self.inputs = {
             "required": OrderedDict(),
             "optional": OrderedDict(),
         }
         self.outputs = OrderedDict()
+        self.output_types = [] # By source handle, since outputs of the same type share a name
 
         annotations = inspect.get_annotations(fn)
         signature = inspect.signature(fn)
 
         self.generator = fn.generator
+        self.asynchronous = fn.asynchronous
+        assert not (batchable and self.generator), f"Generator node {self.fname} can't be batchable"
         self.steps = getattr(fn, "steps", None)
 
         try:
@@ -50,7 +55,8 @@ class NodeInfo:
                 return_annotation = annotations['return']
 
                 if self.generator:
-                    assert typing.get_origin(return_annotation) is Iterator, "Generator node must return I[yield type] type"
+                    iterator = AsyncIterator if self.asynchronous else Iterator
+                    assert typing.get_origin(return_annotation) is iterator, f"Generator node must return {'AI' if self.asynchronous else 'I'}[yield type] type"
                     iterator_args = typing.get_args(return_annotation)
                     assert len(iterator_args) > 0, "Generator return type requires a type in the I[yield type] brackets"
                     return_annotation = iterator_args[0] if len(iterator_args) == 1 else Tuple[iterator_args]
@@ -61,6 +67,9 @@ class NodeInfo:
                 else:
                     self.put('return', return_annotation)
 
+            if not self.outputs:
+                self.terminal = True
+
         except Exception as e:
             logger.exception(e)
             raise Exception(f"Error parsing node {self.name}: {e}")
@@ -131,6 +140,7 @@ class NodeInfo:
 
         if output:
             self.outputs[name] = info
+            self.output_types.append(info.get("type"))
         else:
             self.inputs[necessity][name] = info
     
@@ -140,6 +150,9 @@ class NodeInfo:
             "fname": self.fname, 
             "inputs": self.inputs,
             "outputs": self.outputs,
+            "output_types": self.output_types,
             "display": self.display,
+            "terminal": self.terminal,
+            "batchable": self.batchable,
             **({"steps": self.steps} if self.steps is not None else {})
         }
\ No newline at end of file
@@ -16,7 +16,9 @@ from importlib.metadata import distribution
 import virtualenv
 from dulwich import porcelain
 
-from sdbx.nodes.helpers import cache
+from sdbx.config import config
+from sdbx.isolation import IsolatedPool
+from sdbx.nodes.helpers import cache, ResultCache, GeneratorCache
 
 class NodeManager:
 	def __init__(self, path, nodes_path, env_name=".node_env"):
@@ -88,6 +90,25 @@ class NodeManager:
 	def node_info(self) -> Dict[str, dict]:
 		return { node.info.name: node.info.dict() for node in self.nodes }
 	
+	@cached_property
+	def result_cache(self) -> ResultCache:
+		return ResultCache.from_config(config.memory)
+	
+	@cached_property
+	def generator_cache(self) -> GeneratorCache:
+		return GeneratorCache.from_config(config.memory)
+	
+	@cached_property
+	def isolation(self) -> IsolatedPool:
+		return IsolatedPool(self.env_python)
+	
+	def isolated(self, node) -> bool:
+		# Nodes of modules listed in [extensions] isolate run in worker processes
+		return any(node.__module__ == m or node.__module__.startswith(m + ".") for m in config.extensions.isolate)
+	
 	@cached_property
 	def registry(self) -> Dict[str, Callable]:
-		return { node.__name__: cache(node) for node in self.nodes }
+		return {
+			node.__name__: cache(self.isolation.wrap(node) if self.isolated(node) else node, self.result_cache, self.generator_cache)
+			for node in self.nodes
+		}
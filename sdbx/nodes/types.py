@@ -1,7 +1,7 @@
 from enum import Enum
 from functools import partial
 from dataclasses import dataclass, field
-from inspect import signature, isgeneratorfunction
+from inspect import signature, isgeneratorfunction, iscoroutinefunction, isasyncgenfunction
 from typing import Annotated, Any, Callable, Dict, Generic, Optional, Literal, List, Tuple, Union, get_type_hints
 
 # from torch import Tensor
@@ -26,11 +26,15 @@ def node(fn=None, **kwargs): # Arguments defined in NodeInfo init
             The display name of the node.
         display : bool
             Whether to display the output in the node.
+        batchable : bool
+            Whether the node computes many items in one call. It then gets a list per argument, one
+            value per item, and returns a list of outputs, one per item.
     """
     if fn is None:
         return partial(node, **kwargs)
     
-    fn.generator = isgeneratorfunction(fn)
+    fn.generator = isgeneratorfunction(fn) or isasyncgenfunction(fn)
+    fn.asynchronous = iscoroutinefunction(fn) or isasyncgenfunction(fn) # Awaited on the server loop instead of run in a worker thread
 
     from sdbx.nodes.info import NodeInfo  # Avoid circular import
     fn.info = NodeInfo(fn, **kwargs)
@@ -48,6 +52,7 @@ from typing import Annotated as A                   # A
 
 # Iterators
 from collections.abc import Iterator as I
+from collections.abc import AsyncIterator as AI     # For async generator nodes
 
 # Primitives
 # bool                                              # bool
@@ -0,0 +1,270 @@
+import hashlib
+
+from array import array
+from collections import OrderedDict
+
+import networkx as nx
+from networkx import MultiDiGraph
+
+def expand_sweep(graph: MultiDiGraph, items: list) -> MultiDiGraph:
+    """
+    One copy of the flow per sweep item, with that item's widget overrides (node id -> { widget: value }).
+    Copies are named "<node>#<item>". Identical parts of the copies are merged again when they run, and
+    copies of a batchable node run as one batched call.
+    """
+    expanded = MultiDiGraph(**graph.graph)
+
+    for k, overrides in enumerate(items):
+        unknown = set(overrides) - set(graph.nodes)
+        if unknown:
+            raise ValueError(f"Sweep item {k} overrides nodes not in the flow: {sorted(unknown)}")
+
+        for n, data in graph.nodes(data=True):
+            widget_inputs = { **(data.get('widget_inputs') or {}), **overrides.get(n, {}) }
+            expanded.add_node(f"{n}#{k}", **{ **data, 'widget_inputs': widget_inputs, 'origin': n })
+        for u, v, d in graph.edges(data=True):
+            expanded.add_edge(f"{u}#{k}", f"{v}#{k}", **d)
+
+    return expanded
+
+def apply_overrides(graph: MultiDiGraph, overrides: dict) -> MultiDiGraph:
+    # A copy of the flow with some of its widget values replaced (node id -> { widget: value })
+    unknown = set(overrides) - set(graph.nodes)
+    if unknown:
+        raise ValueError(f"Overrides of nodes not in the flow: {sorted(unknown)}")
+
+    variant = graph.copy() # Attribute dicts are copied, their values shared
+    for n, values in overrides.items():
+        variant.nodes[n]['widget_inputs'] = { **(variant.nodes[n].get('widget_inputs') or {}), **values }
+    return variant
+
+def structure_hash(graph: MultiDiGraph) -> str:
+    # Identifies a flow by its shape only (nodes, functions and wiring), not by its widget values
+    nodes = sorted((str(n), fname) for n, fname in graph.nodes(data='fname'))
+    edges = sorted(
+        (str(u), str(v), d['source_handle'], d['target_handle'])
+        for u, v, d in graph.edges(data=True)
+    )
+    return hashlib.blake2b(repr((nodes, edges)).encode(), digest_size=16).hexdigest()
+
+class ExecutionPlan:
+    """
+    A compiled, array-backed form of a flow's structure.
+
+    Nodes are numbered 0..n-1 and edges 0..m-1. Incoming and outgoing edges are stored
+    CSR-style: the incoming edges of node i are in_edges[in_offsets[i]:in_offsets[i + 1]].
+    Nodes are grouped into units, the strongly connected components of the graph, in
+    topological order; counters and roots refer to units.
+
+    Only nodes that feed a sink (a node of one of the `sinks` functions) are live; the rest
+    are pruned and belong to no unit. A flow without sinks runs entirely.
+
+    Copies of a `batchable` function's node made by a sweep form one batched unit.
+    """
+    def __init__(self, graph: MultiDiGraph, key: str = None, generators: set = frozenset(), sinks: set = frozenset(), batchable: set = frozenset()):
+        self.key = key or structure_hash(graph)
+
+        self.ids = list(graph.nodes)
+        self.index = { n: i for i, n in enumerate(self.ids) }
+        self.fnames = [graph.nodes[n]['fname'] for n in self.ids]
+
+        # Everything upstream of a sink
+        targets = [n for n in self.ids if graph.nodes[n]['fname'] in sinks]
+        live = set(targets)
+        for n in targets:
+            live.update(nx.ancestors(graph, n))
+        self.live = array('b', (not targets or n in live for n in self.ids))
+        self.pruned = [n for i, n in enumerate(self.ids) if not self.live[i]]
+
+        # Flat edge arrays, of edges into live nodes (whose sources are live too)
+        self.edge_sources = array('l')
+        self.edge_targets = array('l')
+        self.edge_source_handles = array('l')
+        self.edge_target_handles = []
+
+        for u, v, d in graph.edges(data=True):
+            if not self.live[self.index[v]]:
+                continue
+            self.edge_sources.append(self.index[u])
+            self.edge_targets.append(self.index[v])
+            self.edge_source_handles.append(d['source_handle'])
+            self.edge_target_handles.append(d['target_handle'])
+
+        self.in_offsets, self.in_edges = self._csr(self.edge_targets)
+        self.out_offsets, self.out_edges = self._csr(self.edge_sources)
+
+        # Strongly connected components are the units of scheduling; a cycle runs as one unit.
+        # Copies of a batchable node are never connected to each other, so they can share a unit too
+        self.units = []
+        self.cyclic = array('b')
+        self.batched = array('b')
+        batches = {} # Original node of a sweep -> its batchable copies
+
+        for component in nx.strongly_connected_components(graph.subgraph(n for i, n in enumerate(self.ids) if self.live[i])):
+            members = sorted(self.index[n] for n in component)
+            cyclic = len(members) > 1 or any(self.edge_targets[e] == members[0] for e in self.outgoing(members[0]))
+            origin = graph.nodes[self.ids[members[0]]].get('origin')
+
+            if not cyclic and origin is not None and self.fnames[members[0]] in batchable:
+                batches.setdefault(origin, []).extend(members)
+                continue
+
+            self.units.append(members)
+            self.cyclic.append(cyclic)
+            self.batched.append(False)
+
+        for members in batches.values():
+            self.units.append(sorted(members))
+            self.cyclic.append(False)
+            self.batched.append(len(members) > 1)
+
+        self.unit_of = array('l', [-1] * len(self.ids))
+        for u, members in enumerate(self.units):
+            for i in members:
+                self.unit_of[i] = u
+
+        for u, members in enumerate(self.units):
+            if self.cyclic[u]:
+                self.units[u] = self._cycle_order(u)
+
+        # Precomputed counters, of edges coming from outside each unit
+        self.in_degree = array('l', [0] * len(self.units))
+        for s, t in zip(self.edge_sources, self.edge_targets):
+            if self.unit_of[s] != self.unit_of[t]:
+                self.in_degree[self.unit_of[t]] += 1
+        self.roots = [u for u in range(len(self.units)) if self.in_degree[u] == 0]
+        self.unit_order = self._topological_order()
+        self.order = [i for u in self.unit_order for i in self.units[u]]
+
+        # Generators and everything fed by one produce streams of results rather than a single result.
+        # Cycles iterate on whole results, so they neither stream nor consume streams
+        self.node_streams = array('b', [0] * len(self.ids))
+        for i in self.order:
+            if not self.cyclic[self.unit_of[i]]:
+                self.node_streams[i] = self.fnames[i] in generators or any(self.node_streams[self.edge_sources[e]] for e in self.incoming(i))
+        self.edge_streams = array('b', (
+            self.node_streams[s] and not self.cyclic[self.unit_of[t]]
+            for s, t in zip(self.edge_sources, self.edge_targets)
+        ))
+
+        # Input maps: static inputs are read from results, streamed ones arrive through edge buffers
+        self.inputs = [
+            [(self.edge_target_handles[e], self.ids[self.edge_sources[e]], self.edge_source_handles[e]) for e in self.incoming(i) if not self.edge_streams[e]]
+            for i in range(len(self.ids))
+        ]
+        self.stream_inputs = [
+            [(e, self.edge_target_handles[e], self.edge_source_handles[e]) for e in self.incoming(i) if self.edge_streams[e]]
+            for i in range(len(self.ids))
+        ]
+
+    def _csr(self, endpoints):
+        # Bucket edge indices by endpoint node
+        offsets = array('l', [0] * (len(self.ids) + 1))
+        for n in endpoints:
+            offsets[n + 1] += 1
+        for i in range(len(self.ids)):
+            offsets[i + 1] += offsets[i]
+
+        edges = array('l', [0] * len(endpoints))
+        fill = array('l', offsets[:-1])
+        for e, n in enumerate(endpoints):
+            edges[fill[n]] = e
+            fill[n] += 1
+
+        return offsets, edges
+
+    def _topological_order(self):
+        # Kahn's algorithm over units
+        remaining = array('l', self.in_degree)
+        order = list(self.roots)
+        for u in order:
+            for e in self.unit_outgoing(u):
+                t = self.unit_of[self.edge_targets[e]]
+                remaining[t] -= 1
+                if remaining[t] == 0:
+                    order.append(t)
+        return order
+
+    def _cycle_order(self, u):
+        # Breadth-first from the members fed from outside (or the first one in the flow), so each pass runs roughly in feedback order
+        members = self.units[u]
+        order = [i for i in members if any(self.unit_of[self.edge_sources[e]] != u for e in self.incoming(i))] or members[:1]
+        seen = set(order)
+        for i in order:
+            for e in self.outgoing(i):
+                t = self.edge_targets[e]
+                if self.unit_of[t] == u and t not in seen:
+                    seen.add(t)
+                    order.append(t)
+        return order
+
+    def signatures(self, graph: MultiDiGraph) -> dict:
+        """
+        Hash each node's function, widget values and upstream signatures, so equal signatures mean equal results.
+        Members of a cycle share the hash of the whole cycle, combined with their own id.
+        """
+        signatures = [None] * len(self.ids)
+
+        def settings(i):
+            widget_inputs = graph.nodes[self.ids[i]].get('widget_inputs') or {}
+            return (self.fnames[i], sorted(widget_inputs.items()))
+
+        def upstream(i, u):
+            return sorted(
+                (self.edge_target_handles[e], signatures[self.edge_sources[e]], self.edge_source_handles[e])
+                for e in self.incoming(i) if self.unit_of[self.edge_sources[e]] != u
+            )
+
+        def digest(key):
+            return hashlib.blake2b(repr(key).encode(), digest_size=16).hexdigest()
+
+        for u in self.unit_order:
+            if not self.cyclic[u]:
+                for i in self.units[u]:
+                    signatures[i] = digest((*settings(i), upstream(i, u)))
+                continue
+
+            members = sorted(self.units[u], key=lambda i: str(self.ids[i]))
+            wiring = sorted(
+                (str(self.ids[self.edge_sources[e]]), self.edge_source_handles[e], str(self.ids[i]), self.edge_target_handles[e])
+                for i in members for e in self.incoming(i) if self.unit_of[self.edge_sources[e]] == u
+            )
+            cycle = digest([(str(self.ids[i]), *settings(i), upstream(i, u)) for i in members] + wiring)
+            for i in members:
+                signatures[i] = digest((cycle, str(self.ids[i])))
+
+        return { self.ids[i]: s for i, s in enumerate(signatures) }
+
+    def unit_outgoing(self, u: int):
+        # Edges leaving unit u
+        return [e for i in self.units[u] for e in self.outgoing(i) if self.unit_of[self.edge_targets[e]] != u]
+
+    def incoming(self, i: int):
+        return self.in_edges[self.in_offsets[i]:self.in_offsets[i + 1]]
+
+    def outgoing(self, i: int):
+        return self.out_edges[self.out_offsets[i]:self.out_offsets[i + 1]]
+
+    def __len__(self):
+        return len(self.ids)
+
+class PlanCache:
+    """
+    Compiled plans keyed by structure hash, so resubmitting a flow skips compilation.
+    """
+    def __init__(self, size: int = 64):
+        self.size = size
+        self.plans = OrderedDict()
+
+    def compile(self, graph: MultiDiGraph, generators: set = frozenset(), sinks: set = frozenset(), batchable: set = frozenset()) -> ExecutionPlan:
+        key = structure_hash(graph)
+
+        plan = self.plans.get(key)
+        if plan is None:
+            plan = self.plans[key] = ExecutionPlan(graph, key, generators, sinks, batchable)
+            if len(self.plans) > self.size:
+                self.plans.popitem(last=False) # Drop the least recently used plan
+        else:
+            self.plans.move_to_end(key)
+
+        return plan
@@ -0,0 +1,115 @@
+import os
+import sys
+import time
+import threading
+
+try:
+    import resource # Unix only
+except ImportError:
+    resource = None
+
+def peak_rss() -> int:
+    # Peak resident set size of this process in bytes, or 0 where it can't be read
+    if resource is None:
+        return 0
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak if sys.platform == "darwin" else peak * 1024 # Linux reports kilobytes
+
+def measure(fn, *args):
+    # Runs in the worker, so CPU time is that of the thread doing the work
+    rss = peak_rss()
+    start, cpu = time.perf_counter(), time.thread_time()
+    result = fn(*args)
+    end, cpu = time.perf_counter(), time.thread_time() - cpu
+    return result, (start, end, cpu, peak_rss() - rss, os.getpid(), threading.current_thread().name)
+
+async def measure_async(awaitable):
+    # Awaiting takes no thread of its own, so there's no CPU time or memory to pin on it
+    start = time.perf_counter()
+    result = await awaitable
+    return result, (start, time.perf_counter(), 0.0, 0, os.getpid(), threading.current_thread().name)
+
+class NodeProfile:
+    """
+    Where one node of a task spent its time. A node runs once per call, or once per item when it consumes a stream,
+    and a generator's body runs a step per yield; every run or step is a span.
+    """
+    def __init__(self, node: str, fname: str):
+        self.node = node
+        self.fname = fname
+        self.calls = 0
+        self.yields = 0
+        self.wall = 0.0 # Seconds spent running
+        self.cpu = 0.0 # CPU seconds of the running thread
+        self.queue_wait = 0.0 # Seconds between asking for a worker and starting on one
+        self.rss_delta = 0 # Growth of the process's peak RSS while running; shared by nodes that overlap
+        self.output_size = 0 # Estimated bytes of the largest result
+        self.reused = False
+        self.merged = None # Identical node whose results it shared instead of running
+        self.batched = 0 # Size of the batch it ran in, if it ran in one
+        self.spans = [] # (start, end, pid, thread)
+
+    def record(self, requested: float, measurement: tuple):
+        start, end, cpu, rss_delta, pid, thread = measurement
+        self.wall += end - start
+        self.cpu += cpu
+        self.queue_wait += max(0.0, start - requested)
+        self.rss_delta += rss_delta
+        self.spans.append((start, end, pid, thread))
+
+    def dict(self, origin: float = 0.0):
+        return {
+            "node": self.node,
+            "fname": self.fname,
+            "calls": self.calls,
+            "yields": self.yields,
+            "wall": self.wall,
+            "cpu": self.cpu,
+            "queue_wait": self.queue_wait,
+            "rss_delta": self.rss_delta,
+            "output_size": self.output_size,
+            "reused": self.reused,
+            "merged": self.merged,
+            "batched": self.batched,
+            "started": self.spans[0][0] - origin if self.spans else None,
+            "finished": self.spans[-1][1] - origin if self.spans else None,
+        }
+
+class TaskProfile:
+    """
+    Per-node profiles of one task, as JSON or as a Chrome trace (chrome://tracing, Perfetto).
+    """
+    def __init__(self, ids: list = (), fnames: list = ()):
+        self.origin = time.perf_counter()
+        self.nodes = { node: NodeProfile(node, fname) for node, fname in zip(ids, fnames) }
+
+    def dict(self):
+        nodes = [profile.dict(self.origin) for profile in self.nodes.values()]
+        return {
+            "nodes": sorted(nodes, key=lambda n: n["wall"], reverse=True), # Hottest first
+            "wall": sum(n["wall"] for n in nodes),
+            "cpu": sum(n["cpu"] for n in nodes),
+        }
+
+    def trace(self):
+        events = []
+        threads = {} # (pid, thread name) -> tid, since trace viewers want numbers
+
+        for profile in self.nodes.values():
+            for start, end, pid, thread in profile.spans:
+                if (pid, thread) not in threads:
+                    tid = threads[(pid, thread)] = len(threads) + 1
+                    events.append({ "ph": "M", "name": "thread_name", "pid": pid, "tid": tid, "args": { "name": thread } })
+
+                events.append({
+                    "name": profile.fname,
+                    "cat": "node",
+                    "ph": "X",
+                    "ts": (start - self.origin) * 1e6,
+                    "dur": (end - start) * 1e6,
+                    "pid": pid,
+                    "tid": threads[(pid, thread)],
+                    "args": { "node": profile.node },
+                })
+
+        return { "traceEvents": events, "displayTimeUnit": "ms" }
@@ -0,0 +1,123 @@
+import os
+import shutil
+import tempfile
+
+from asyncio import to_thread
+from urllib.parse import quote
+
+from PIL import Image
+
+from sdbx import config
+from sdbx.server.serialize import MIME_TYPES, encode_image
+
+def images(result) -> list:
+    # Images in a result, in the order their indices count them
+    if isinstance(result, Image.Image):
+        return [result]
+    if isinstance(result, (tuple, list)):
+        return [image for value in result for image in images(value)]
+    if isinstance(result, dict):
+        return [image for value in result.values() for image in images(value)]
+    return []
+
+def safe(name) -> str:
+    # One path component, whatever the node id holds
+    name = quote(str(name), safe="")
+    if name in ("", ".", ".."):
+        raise ValueError(f"Invalid output name: {name!r}")
+    return name
+
+class OutputStore:
+    """
+    Images of task results as files, served from /outputs/{task}/{node}/{index}.
+
+    A node's images are written once per version of its result (the seq of the bus message that announced it),
+    and only its latest version is kept. URLs carry the version, so what they point to never changes.
+    Given the executor's `tasks`, writing also removes the files of tasks it has since forgotten.
+    """
+    def __init__(self, directory: str = None, format: str = None, quality: int = None, tasks: dict = None):
+        self.directory = directory or config.get_path("served")
+        self.tasks = tasks
+        self.format = format or config.web.image_format
+        self.quality = quality or config.web.image_quality
+
+    @property
+    def mime(self):
+        return MIME_TYPES[self.format]
+
+    def url(self, tid: str, node, index: int, version: int) -> str:
+        return f"/outputs/{safe(tid)}/{safe(node)}/{index}?v={version}"
+
+    def node_directory(self, tid: str, node) -> str:
+        return os.path.join(self.directory, safe(tid), safe(node))
+
+    def path(self, tid: str, node, index: int, version: int = None) -> str:
+        # The file of an image, of the given version or of the latest one on disk
+        directory = self.node_directory(tid, node)
+        if version is None:
+            versions = [int(v) for v in os.listdir(directory) if v.isdigit()] if os.path.isdir(directory) else []
+            if not versions:
+                return None
+            version = max(versions)
+        return os.path.join(directory, str(version), f"{index}.{self.format}")
+
+    def live(self):
+        # Ids of the tasks still known, taken on the loop since the executor changes them there
+        return None if self.tasks is None else { safe(tid) for tid in self.tasks }
+
+    def write(self, tid: str, node, version: int, result, live: set = None):
+        directory = self.node_directory(tid, node)
+        target = os.path.join(directory, str(version))
+        if os.path.isdir(target):
+            return
+
+        # Written aside and moved into place, so a version's files appear all at once. Anyone else writing
+        # the same version writes the same files, so whoever moves theirs in first wins
+        os.makedirs(directory, exist_ok=True)
+        partial = tempfile.mkdtemp(prefix=".partial-", dir=directory)
+        try:
+            for index, image in enumerate(images(result)):
+                with open(os.path.join(partial, f"{index}.{self.format}"), "wb") as f:
+                    f.write(encode_image(image, self.format, self.quality))
+            os.replace(partial, target)
+        except OSError:
+            if not os.path.isdir(target):
+                raise
+        finally:
+            shutil.rmtree(partial, ignore_errors=True)
+
+        for entry in os.listdir(directory): # Older versions are superseded
+            if entry.isdigit() and int(entry) < version:
+                shutil.rmtree(os.path.join(directory, entry), ignore_errors=True)
+
+        if live is not None:
+            self.prune(live)
+
+    def prune(self, live: set):
+        for entry in os.listdir(self.directory):
+            if entry not in live:
+                shutil.rmtree(os.path.join(self.directory, entry), ignore_errors=True)
+
+    async def references(self, tid: str, results: dict, versions: dict) -> dict:
+        # Results with their images written out and replaced by { "url": ..., "mime": ... }
+        referenced = {}
+        for node, result in results.items():
+            version = versions.get(node)
+            if version is None or not images(result):
+                referenced[node] = result
+                continue
+
+            await to_thread(self.write, tid, node, version, result, self.live())
+            counter = iter(range(len(images(result))))
+
+            def replace(value):
+                if isinstance(value, Image.Image):
+                    return { "url": self.url(tid, node, next(counter), version), "mime": self.mime }
+                if isinstance(value, (tuple, list)):
+                    return [replace(v) for v in value]
+                if isinstance(value, dict):
+                    return { k: replace(v) for k, v in value.items() }
+                return value
+
+            referenced[node] = replace(result)
+        return referenced
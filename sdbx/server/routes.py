@@ -1,15 +1,22 @@
+import os
 import json
 import uuid
 import logging
-from asyncio import create_task, wait, FIRST_COMPLETED
+from typing import Optional
+from asyncio import Lock, create_task, to_thread
+from weakref import WeakKeyDictionary
 
 from networkx import node_link_graph
-from fastapi import APIRouter, WebSocket, WebSocketDisconnect
-from fastapi.responses import PlainTextResponse
+from fastapi import APIRouter, Request, WebSocket, WebSocketDisconnect
+from fastapi.responses import PlainTextResponse, JSONResponse, FileResponse, Response
 
 from sdbx import config, logger
-from sdbx.server.types import Graph
-from sdbx.server.serialize import WebEncoder
+from sdbx.plan import expand_sweep, apply_overrides
+from sdbx.server.types import Graph, PromptBatch
+from sdbx.server.serialize import BinaryResults, ResultPayloads, dumps
+from sdbx.server.outputs import OutputStore
+
+result_payloads = WeakKeyDictionary() # TaskContext -> ResultPayloads, shared by the sockets following it
 
 def register_update_signal(rtr: APIRouter):
     @rtr.websocket("/ws/update")
@@ -21,27 +28,173 @@ def register_node_routes(rtr: APIRouter):
     def list_nodes():
         return config.node_manager.node_info
     
+    @rtr.get("/cache")
+    def cache_stats():
+        return {
+            "results": config.node_manager.result_cache.stats(),
+            "generators": config.node_manager.generator_cache.stats(),
+        }
+    
     @rtr.post("/prompt")
-    def start_prompt(graph: Graph):
+    async def start_prompt(graph: Graph, request: Request, priority: int = 0, client_id: Optional[str] = None, max_concurrency: Optional[int] = None):
         tid = str(uuid.uuid4())
         try:
-            task = config.executor.execute(node_link_graph(graph.dict()), tid)
-            return {"task_id": tid}
+            client = client_id or (request.client.host if request.client else None)
+            g = node_link_graph(graph.dict())
+            if graph.sweep:
+                g = expand_sweep(g, graph.sweep) # Results come back per copy, as "<node>#<item>"
+            plan = config.executor.compile(g) # Cached, so the run itself won't compile or validate it again
+
+            errors = config.executor.validator.check(g, plan)
+            if errors:
+                return JSONResponse({"error": "Invalid flow", "errors": errors}, status_code=422)
+
+            config.scheduler.submit(g, tid, priority=priority, client=client, max_concurrency=max_concurrency) # Nodes at a time, max-concurrent-nodes by default
+            return {"task_id": tid, "position": config.scheduler.position(tid), "pruned": plan.pruned}
         except Exception as e:
             logger.exception(e)
             return {"error": str(e)}
     
+    @rtr.post("/prompts/batch")
+    async def start_prompts(batch: PromptBatch, request: Request, priority: int = 0, client_id: Optional[str] = None, max_concurrency: Optional[int] = None):
+        # One flow with per-task widget overrides, and/or many flows. All are checked before any is queued,
+        # and they're queued back to back under one client, so they run in order on the same loaded models
+        try:
+            client = client_id or (request.client.host if request.client else None)
+            graphs, errors = [], []
+
+            def prepare(graph: Graph):
+                g = node_link_graph(graph.dict())
+                if graph.sweep:
+                    g = expand_sweep(g, graph.sweep)
+                return g, config.executor.compile(g)
+
+            if batch.flow is not None:
+                g, plan = prepare(batch.flow)
+                variants = batch.variants or [{}]
+                for overrides, variant_errors in zip(variants, config.executor.validator.check_variants(g, plan, variants)):
+                    if variant_errors:
+                        errors.append({"index": len(graphs), "errors": variant_errors})
+                    graphs.append(apply_overrides(g, overrides) if not variant_errors else None)
+
+            for flow in batch.flows or []:
+                g, plan = prepare(flow)
+                flow_errors = config.executor.validator.check(g, plan)
+                if flow_errors:
+                    errors.append({"index": len(graphs), "errors": flow_errors})
+                graphs.append(g)
+
+            if errors:
+                return JSONResponse({"error": "Invalid flows", "errors": errors}, status_code=422)
+
+            tids = [str(uuid.uuid4()) for _ in graphs]
+            for g, tid in zip(graphs, tids):
+                config.scheduler.submit(g, tid, priority=priority, client=client, validated=True, max_concurrency=max_concurrency)
+            return {"task_ids": tids}
+        except Exception as e:
+            logger.exception(e)
+            return {"error": str(e)}
+
     @rtr.post("/kill/{tid}")
-    def kill_prompt(tid: str):
+    async def kill_prompt(tid: str):
         try:
-            config.executor.halt(tid)
+            config.scheduler.cancel(tid)
             return {"task_id": tid}
         except Exception as e:
             logger.exception(e)
             return {"error": str(e)}
     
+    @rtr.get("/queue")
+    def list_queue():
+        return config.scheduler.dict()
+    
+    @rtr.get("/tasks")
+    def list_tasks(state: Optional[str] = None):
+        return [
+            {"task_id": tid, "state": task_context.state, "position": config.scheduler.position(tid), "seq": task_context.bus.seq}
+            for tid, task_context in list(config.executor.tasks.items()) if state is None or task_context.state == state
+        ]
+
+    @rtr.get("/tasks/{tid}")
+    def task_status(tid: str):
+        task_context = config.executor.tasks.get(tid)
+        if not task_context:
+            return JSONResponse({"error": "Invalid task ID"}, status_code=404)
+        return {"task_id": tid, "position": config.scheduler.position(tid), **task_context.dict()}
+
+    @rtr.get("/tasks/{tid}/results")
+    async def task_results(tid: str, request: Request, since: int = 0, urls: Optional[bool] = None):
+        # Results newer than the seq `since`, as the websocket would send them. The ETag is the task's seq, so polls
+        # that find nothing new get a 304
+        task_context = config.executor.tasks.get(tid)
+        if not task_context:
+            return JSONResponse({"error": "Invalid task ID"}, status_code=404)
+
+        seq = task_context.bus.seq
+        headers = {"ETag": f'"{seq}"', "Cache-Control": "no-cache"}
+        if headers["ETag"] in request.headers.get("if-none-match", ""):
+            return Response(status_code=304, headers=headers)
+
+        results = {node: task_context.results[node] for node in task_context.results if not since or (task_context.versions.get(node) or 0) > since}
+        versions = {node: task_context.versions.get(node) for node in results}
+        data = {"task_id": tid, "seq": seq, "state": task_context.state, "versions": versions}
+
+        if config.web.output_urls if urls is None else urls:
+            text = await to_thread(dumps, {**data, "results": await OutputStore(tasks=config.executor.tasks).references(tid, results, versions)})
+        else:
+            payloads = result_payloads.setdefault(task_context, ResultPayloads())
+            text = await to_thread(payloads.message, data, results, versions)
+        return Response(text, media_type="application/json", headers=headers)
+
+    @rtr.get("/tasks/{tid}/profile")
+    def task_profile(tid: str):
+        task_context = config.executor.tasks.get(tid)
+        if not task_context or not task_context.profile:
+            return JSONResponse({"error": "Invalid task ID"}, status_code=404)
+        return {"task_id": tid, **task_context.profile.dict()}
+    
+    @rtr.get("/tasks/{tid}/profile/trace")
+    def task_profile_trace(tid: str):
+        # Chrome trace-event file, for chrome://tracing or Perfetto
+        task_context = config.executor.tasks.get(tid)
+        if not task_context or not task_context.profile:
+            return JSONResponse({"error": "Invalid task ID"}, status_code=404)
+        return JSONResponse(
+            task_context.profile.trace(),
+            headers={"Content-Disposition": f'attachment; filename="{tid}.trace.json"'}
+        )
+    
+    @rtr.get("/outputs/{tid}/{node}/{index}")
+    async def task_output(tid: str, node: str, index: int, request: Request, v: Optional[int] = None):
+        # An image of a task's result, streamed from disk. Versioned URLs never change, so they're cached for good
+        outputs = OutputStore(tasks=config.executor.tasks)
+        try:
+            path = outputs.path(tid, node, index, v)
+            if path is None or not os.path.isfile(path):
+                # Not written out yet; the task may still hold it
+                task_context = config.executor.tasks.get(tid)
+                key = next((n for n in task_context.results if str(n) == node), None) if task_context else None
+                version = task_context.versions.get(key) if key is not None else None
+                if version is not None and v in (None, version) and key in task_context.results: # Not released yet
+                    await to_thread(outputs.write, tid, key, version, task_context.results[key], outputs.live())
+                    path = outputs.path(tid, node, index, version)
+        except ValueError as e:
+            return JSONResponse({"error": str(e)}, status_code=404)
+
+        if path is None or not os.path.isfile(path):
+            return JSONResponse({"error": "Output not found"}, status_code=404)
+
+        stat = os.stat(path) # Files are replaced, never rewritten, so these identify the content
+        headers = {
+            "ETag": f'"{stat.st_ino:x}-{stat.st_mtime_ns:x}-{stat.st_size:x}"',
+            "Cache-Control": "public, max-age=31536000, immutable" if v is not None else "no-cache",
+        }
+        if headers["ETag"] in request.headers.get("if-none-match", ""):
+            return Response(status_code=304, headers=headers)
+        return FileResponse(path, media_type=outputs.mime, headers=headers) # Handles Range requests
+
     @rtr.websocket("/ws/task/{tid}")
-    async def task_subscribe_websocket(websocket: WebSocket, tid: str):
+    async def task_subscribe_websocket(websocket: WebSocket, tid: str, binary: Optional[bool] = None, urls: Optional[bool] = None):
         await websocket.accept()
 
         task_context = config.executor.tasks.get(tid)
@@ -51,54 +204,93 @@ def register_node_routes(rtr: APIRouter):
             await websocket.close()
             return
         
-        websocket.send_serialized = lambda data: websocket.send({
-            "type": "websocket.send", 
-            "text": json.dumps(data, separators=(",", ":"), ensure_ascii=False, cls=WebEncoder)
-        })
+        # URL mode sends references to images served from /outputs; binary mode sends results as a JSON header,
+        # then each of its images as a binary frame
+        outputs = OutputStore(tasks=config.executor.tasks) if (config.web.output_urls if urls is None else urls) else None
+        binary_results = BinaryResults() if (config.web.binary_results if binary is None else binary) and not outputs else None
+        payloads = result_payloads.setdefault(task_context, ResultPayloads())
+        sending = Lock() # A message and its frames go out together
+
+        async def send_json(data):
+            async with sending:
+                await websocket.send_json(data)
+
+        async def send_results(data, results):
+            versions = { node: task_context.versions.get(node) for node in results }
+            async with sending:
+                if outputs is not None:
+                    text = await to_thread(dumps, { **data, "versions": versions, "results": await outputs.references(tid, results, versions) })
+                    return await websocket.send_text(text)
+
+                if binary_results is None:
+                    text = await to_thread(payloads.message, { **data, "versions": versions }, results, versions) # Images are encoded here
+                    return await websocket.send_text(text)
+
+                header, frames = await binary_results.split(results, versions)
+                text = await to_thread(dumps, { **data, "versions": versions, "results": header, "frames": len(frames) })
+                await websocket.send_text(text)
+                for frame in frames:
+                    await websocket.send_bytes(frame)
+
+        async def send_snapshot():
+            # Everything so far, for a client that's (re)connecting or has lost track
+            seq = task_context.bus.seq
+            await send_results({ "task_id": tid, "seq": seq, "snapshot": True, "state": task_context.state }, task_context.results.copy())
+            return seq
 
         async def notifier():
             try:
-                while True:
-                    # Wait for either result_event or error_event
-                    await wait(
-                        [
-                            create_task(task_context.result_event.wait()), 
-                            create_task(task_context.error_event.wait()),
-                            create_task(task_context.completion_event.wait())
-                        ],
-                        return_when=FIRST_COMPLETED
-                    )
-                    
-                    if task_context.error_event.is_set():
-                        raise task_context.task_error
-                    elif task_context.completion_event.is_set():
-                        await websocket.send_serialized({"task_id": tid, "results": dict(task_context.results), "completed": True})
+                # Any number of sockets can follow a task; after a snapshot, each gets only the results that changed
+                seq = await send_snapshot()
+                if task_context.bus.closed and task_context.bus.seq == seq:
+                    seq -= 1 # Finished before the snapshot; replay the final message, so the client learns how and the socket closes
+
+                async for message in task_context.bus.subscribe(since=seq):
+                    if message["type"] == "error":
+                        await send_json({"task_id": tid, "seq": message["seq"], "error": message["error"]})
+                        await websocket.close()
+                        return
+                    elif message["type"] == "cancelled":
+                        await send_json({"task_id": tid, "seq": message["seq"], "cancelled": True})
+                        await websocket.close()
+                        return
+                    elif message["type"] == "completed":
+                        await send_json({"task_id": tid, "seq": message["seq"], "completed": True})
                         await websocket.close()
                         return
-                    elif task_context.result_event.is_set():
-                        print("sending results")
-                        # Send the latest results of the task to the websocket
-                        await websocket.send_serialized({"task_id": tid, "results": dict(task_context.results)})
+                    elif message["type"] == "state":
+                        await send_json({"task_id": tid, "seq": message["seq"], "state": message["state"]})
+                    elif message["type"] == "gap":
+                        await send_snapshot()
+                    else:
+                        node = message["node"]
+                        if task_context.versions.get(node) != message["seq"] or node not in task_context.results:
+                            continue # Superseded by a later result, which has its own message, or already released
 
-                        # Inform that results are finished processing
-                        task_context.process_event.set() # All events are cleared by the executor
+                        await send_results({"task_id": tid, "seq": message["seq"]}, { node: task_context.results[node] })
             except Exception as e:
                 # If error occurred, send error message and close the WebSocket
                 logger.exception(e)
                 logger.error("sending websocket error")
-                await websocket.send_json({"task_id": tid, "error": task_context.task_error})
+                await websocket.send_json({"task_id": tid, "error": str(e)})
                 await websocket.close()
                 return
 
         ntask = create_task(notifier())
+        snapshots = set()
 
         try:
-            # Keep the websocket open
+            # Keep the websocket open; clients may ask for a fresh snapshot with "snapshot"
             while True:
-                await websocket.receive_text()  # You can use this to receive pings or other messages
+                if await websocket.receive_text() == "snapshot":
+                    snapshot = create_task(send_snapshot())
+                    snapshots.add(snapshot)
+                    snapshot.add_done_callback(snapshots.discard)
         except WebSocketDisconnect:
             # Cleanup when the WebSocket is disconnected
             ntask.cancel()
+            for snapshot in snapshots:
+                snapshot.cancel()
         finally:
             try:
                 await websocket.close()
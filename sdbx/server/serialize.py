@@ -2,15 +2,29 @@ import io
 import json
 import base64
 
+from asyncio import to_thread
+
 from PIL import Image
 
+from sdbx import config
+
+MIME_TYPES = { "png": "image/png", "webp": "image/webp", "jpeg": "image/jpeg" }
+
+def encode_image(image, format: str = None, quality: int = None) -> bytes:
+    format = format or config.web.image_format
+    if format == "jpeg" and image.mode not in ("RGB", "L"):
+        image = image.convert("RGB") # No alpha in JPEG
+
+    buffered = io.BytesIO()
+    image.save(buffered, format=format.upper(), quality=quality or config.web.image_quality) # PNG ignores quality
+    return buffered.getvalue()
+
 class WebEncoder(json.JSONEncoder):
     @staticmethod
     def serialize_image(image):
-        buffered = io.BytesIO()
-        image.save(buffered, format="PNG")  # Save the image in PNG format
-        img_base64 = base64.b64encode(buffered.getvalue()).decode('utf-8')
-        return f"data:image/png;base64,{img_base64}"
+        format = config.web.image_format
+        img_base64 = base64.b64encode(encode_image(image, format)).decode('utf-8')
+        return f"data:{MIME_TYPES[format]};base64,{img_base64}"
 
     def default(self, obj):
         if isinstance(obj, Image.Image):
@@ -18,4 +32,73 @@ class WebEncoder(json.JSONEncoder):
         try:
             return super().default(obj)
         except (TypeError, OverflowError, ValueError):
-            return str(data)
\ No newline at end of file
+            return str(obj)
+
+def dumps(data) -> str:
+    return json.dumps(data, separators=(",", ":"), ensure_ascii=False, cls=WebEncoder)
+
+class ResultPayloads:
+    """
+    Serialized results of one task, shared by everyone following it. A node's result is serialized once
+    per version (the seq of the bus message that announced it), however many messages carry it.
+    """
+    def __init__(self):
+        self.payloads = {} # node -> (version, JSON)
+
+    def payload(self, node, version: int, result) -> str:
+        if version is None: # Not announced, so nothing to tell its versions apart
+            return dumps(result)
+
+        entry = self.payloads.get(node)
+        if entry is None or entry[0] != version:
+            entry = self.payloads[node] = (version, dumps(result))
+        return entry[1]
+
+    def message(self, data: dict, results: dict, versions: dict) -> str:
+        # The JSON of data, with "results" spliced in from the cached payloads
+        body = ",".join(f"{dumps(str(node))}:{self.payload(node, versions.get(node), result)}" for node, result in results.items())
+        head = dumps(data)[:-1]
+        return f'{head}{"," if data else ""}"results":{{{body}}}}}'
+
+class BinaryResults:
+    """
+    Results split into a JSON-able header and the images that follow it as binary frames.
+
+    Images are replaced in the header by { "frame": index, "mime": type, "size": bytes }. They're encoded
+    off the loop, and once per version of a node's result, so a snapshot doesn't encode the updates' images
+    again. Only the bytes are kept, so the images themselves can go once the task releases them.
+    """
+    def __init__(self, format: str = None, quality: int = None):
+        self.format = format or config.web.image_format
+        self.quality = quality or config.web.image_quality
+        self.encoded = {} # node -> (version, [bytes])
+
+    async def split(self, results: dict, versions: dict = None):
+        images, slots = {}, []
+
+        def replace(value, node):
+            if isinstance(value, Image.Image):
+                images.setdefault(node, []).append(value)
+                slots.append({ "frame": len(slots), "mime": MIME_TYPES[self.format] })
+                return slots[-1]
+            if isinstance(value, (tuple, list)):
+                return [replace(v, node) for v in value]
+            if isinstance(value, dict):
+                return { k: replace(v, node) for k, v in value.items() }
+            return value
+
+        header = { node: replace(result, node) for node, result in results.items() }
+
+        frames = []
+        for node, node_images in images.items():
+            version = (versions or {}).get(node)
+            entry = self.encoded.get(node)
+            if version is None or entry is None or entry[0] != version:
+                entry = (version, [await to_thread(encode_image, image, self.format, self.quality) for image in node_images])
+                if version is not None: # Not announced, so nothing to tell its versions apart
+                    self.encoded[node] = entry
+            frames.extend(entry[1])
+
+        for slot, frame in zip(slots, frames):
+            slot["size"] = len(frame)
+        return header, frames
@@ -26,4 +26,10 @@ class Graph(BaseModel):
     multigraph: bool
     graph: dict
     nodes: List[Node]
-    links: List[Link]
\ No newline at end of file
+    links: List[Link]
+    sweep: Optional[List[Dict[str, Dict[str, Any]]]] = None # Per item: node id -> widget overrides
+
+class PromptBatch(BaseModel):
+    flow: Optional[Graph] = None
+    variants: Optional[List[Dict[str, Dict[str, Any]]]] = None # Per task of flow: node id -> widget overrides
+    flows: Optional[List[Graph]] = None
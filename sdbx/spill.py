@@ -0,0 +1,146 @@
+import os
+import uuid
+import weakref
+
+from asyncio import create_task, to_thread
+
+from sdbx import config, logger
+from sdbx.nodes.helpers import estimate_size
+
+mapped = weakref.WeakValueDictionary() # id -> value already backed by a spill file; arrays aren't hashable
+
+def current_rss() -> int:
+    # Resident set size of this process in bytes, or 0 where it can't be read
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, AttributeError):
+        return 0
+
+def remove(path: str):
+    try:
+        os.remove(path)
+    except OSError: # Already gone, or still mapped on Windows
+        pass
+
+def spillable(value) -> bool:
+    if mapped.get(id(value)) is value:
+        return False
+    if hasattr(value, "element_size") and hasattr(value, "numpy"): # torch.Tensor
+        return value.device.type == "cpu"
+    return hasattr(value, "tofile") and hasattr(value, "dtype") # numpy.ndarray
+
+class Spilled:
+    """
+    Stand-in for a tensor or array written to disk. Loading maps the file back rather than reading it in,
+    so its pages are only resident while used. The file is removed once the stand-in is dropped.
+    """
+    def __init__(self, path: str, dtype, shape: tuple, torch: bool):
+        self.path = path
+        self.dtype = dtype
+        self.shape = shape
+        self.torch = torch
+        weakref.finalize(self, remove, path)
+
+    def load(self):
+        import numpy as np
+        value = np.memmap(self.path, dtype=self.dtype, mode="c", shape=self.shape) # Copy-on-write, so consumers may still modify it
+
+        if self.torch:
+            import torch
+            value = torch.from_numpy(value)
+
+        mapped[id(value)] = value
+        return value
+
+def spill(value, directory: str):
+    # Write a CPU tensor or array out as its raw buffer; anything else stays as it is
+    if not spillable(value):
+        return value
+
+    torch = hasattr(value, "element_size")
+    try:
+        import numpy as np
+        array = np.ascontiguousarray(value.detach().numpy() if torch else value)
+    except TypeError: # No numpy equivalent, like bfloat16
+        return value
+
+    path = os.path.join(directory, f"{uuid.uuid4().hex}.bin")
+    array.tofile(path)
+    return Spilled(path, array.dtype, array.shape, torch)
+
+class Results(dict):
+    """
+    Results of a task's nodes, by node id. Entries the spill store wrote out are mapped back in when read.
+    """
+    def __getitem__(self, node):
+        result = super().__getitem__(node)
+        if any(isinstance(value, Spilled) for value in result):
+            result = tuple(value.load() if isinstance(value, Spilled) else value for value in result)
+            super().__setitem__(node, result)
+        return result
+
+    def get(self, node, default=None):
+        return self[node] if node in self else default
+
+    def copy(self):
+        return { node: self[node] for node in self }
+
+class SpillStore:
+    """
+    Moves tensors and arrays held by tasks to disk when the process's RSS crosses the watermark.
+
+    Older tasks and older results go first, until the estimated bytes written out cover the excess.
+    Spilled values are dropped from the `caches` (result caches) too, or they'd stay in memory regardless.
+    Values a running node still holds only free memory once it's done with them.
+    """
+    def __init__(self, directory: str = None, watermark: int = None, caches: list = ()):
+        self.directory = directory or config.get_path("spill")
+        self.watermark = config.memory.spill_bytes if watermark is None else watermark
+        self.caches = caches
+        self.spilling = None
+        self.spilled = 0 # Results written out so far
+
+    def check(self, contexts):
+        # Cheap enough to run after every result; the writing happens off the loop
+        if not self.watermark or self.spilling is not None:
+            return
+
+        excess = current_rss() - self.watermark
+        if excess <= 0:
+            return
+
+        victims = self.select(contexts, excess)
+        if victims:
+            logger.info(f"Memory above the spill watermark by {excess // 1024 ** 2} MB, spilling {len(victims)} results to disk")
+            self.spilling = create_task(self.relieve(victims))
+
+    def select(self, contexts, excess: int) -> list:
+        victims = []
+        for context in contexts:
+            # Results kept only for a later run go before those the run may still read
+            for results in (getattr(context, "kept", {}), context.results):
+                for node, result in dict.items(results):
+                    size = sum(estimate_size(value) for value in result if spillable(value))
+                    if size:
+                        victims.append((results, node, result))
+                        excess -= size
+                    if excess <= 0:
+                        return victims
+        return victims
+
+    async def relieve(self, victims: list):
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+            for results, node, result in victims:
+                spilled = await to_thread(lambda: tuple(spill(value, self.directory) for value in result))
+
+                if dict.get(results, node) is result: # Not replaced or released in the meantime
+                    dict.__setitem__(results, node, spilled)
+                    self.spilled += 1
+                    for cache in self.caches:
+                        cache.forget([value for value in result if spillable(value)])
+        except Exception as e:
+            logger.exception(e)
+        finally:
+            self.spilling = None
@@ -0,0 +1,153 @@
+import hashlib
+
+from collections import OrderedDict
+
+from networkx import MultiDiGraph
+
+from sdbx.plan import ExecutionPlan
+
+class FlowError(Exception):
+    """
+    A flow that can't run as submitted, with every problem found in it.
+    """
+    def __init__(self, errors: list):
+        super().__init__("; ".join(error["message"] for error in errors))
+        self.errors = errors
+
+def compatible(source: str, target: dict) -> bool:
+    # Whether an output of type `source` can feed an input described by `target`
+    target_type = target.get("type")
+    if source == target_type or "Any" in (source, target_type):
+        return True
+    if target_type == "OneOf":
+        return all(type(choice).__name__.capitalize() == source for choice in target.get("choices", ()))
+    return (source, target_type) == ("Int", "Float")
+
+class FlowValidator:
+    """
+    Checks a flow against the nodes' NodeInfo before anything runs: functions exist, every edge
+    connects an existing output to an input of a matching type, required inputs are given and
+    choices are valid. Results are cached per flow (structure and widget values).
+    """
+    def __init__(self, node_manager, size: int = 64):
+        self.node_manager = node_manager
+        self.size = size
+        self.results = OrderedDict()
+        self._parameters = {}
+
+    def parameters(self, fname: str) -> dict:
+        # Argument name -> (required, info)
+        if fname not in self._parameters:
+            inputs = self.node_manager.registry[fname].info.inputs
+            self._parameters[fname] = {
+                info["fname"]: (necessity == "required", info)
+                for necessity in ("required", "optional") for info in inputs[necessity].values()
+            }
+        return self._parameters[fname]
+
+    def check(self, graph: MultiDiGraph, plan: ExecutionPlan) -> list:
+        widgets = sorted((str(n), repr(sorted((w or {}).items()))) for n, w in graph.nodes(data='widget_inputs'))
+        key = hashlib.blake2b(repr((plan.key, widgets)).encode(), digest_size=16).hexdigest()
+
+        errors = self.results.get(key)
+        if errors is None:
+            errors = self.results[key] = self.validate(graph, plan)
+            if len(self.results) > self.size:
+                self.results.popitem(last=False)
+        else:
+            self.results.move_to_end(key)
+
+        return errors
+
+    def check_variants(self, graph: MultiDiGraph, plan: ExecutionPlan, variants: list) -> list:
+        """
+        Errors of each variant of a flow (node id -> widget overrides). The flow itself is checked once;
+        a variant only rechecks the nodes it overrides.
+        """
+        base = self.check(graph, plan)
+        checked = []
+
+        for overrides in variants:
+            errors = [e for e in base if e["node"] not in overrides]
+            for node, values in overrides.items():
+                i = plan.index.get(node)
+                if i is None:
+                    errors.append({ "code": "unknown_node", "node": node, "message": f"Node {node} is not in the flow" })
+                elif plan.live[i]:
+                    widget_inputs = { **(graph.nodes[node].get('widget_inputs') or {}), **values }
+                    errors.extend(self.validate_node(plan, i, widget_inputs))
+            checked.append(errors)
+
+        return checked
+
+    def validate(self, graph: MultiDiGraph, plan: ExecutionPlan) -> list:
+        errors = []
+        for i, node in enumerate(plan.ids):
+            if plan.live[i]: # Pruned nodes won't run anyway
+                errors.extend(self.validate_node(plan, i, graph.nodes[node].get('widget_inputs') or {}))
+        return errors
+
+    def validate_node(self, plan: ExecutionPlan, i: int, widget_inputs: dict) -> list:
+        errors = []
+        registry = self.node_manager.registry
+        node = plan.ids[i]
+
+        def error(code, node, message, **details):
+            errors.append({ "code": code, "node": node, **details, "message": message })
+
+        fname = plan.fnames[i]
+        if fname not in registry:
+            error("unknown_node", node, f"Node {node} uses unknown function {fname}")
+            return errors
+
+        parameters = self.parameters(fname)
+        connected = {}
+
+        # In a cycle, inputs fed back from a member that runs later are missing on the first pass
+        u = plan.unit_of[i]
+        order = plan.units[u] if plan.cyclic[u] else ()
+
+        for e in plan.incoming(i):
+            handle = plan.edge_target_handles[e]
+            source = plan.edge_sources[e]
+            source_handle = plan.edge_source_handles[e]
+            edge = { "source": plan.ids[source], "source_handle": source_handle, "target_handle": handle }
+
+            if handle not in parameters:
+                error("unknown_input", node, f"Node {node} has no input {handle}", **edge)
+                continue
+            if handle in connected:
+                error("duplicate_input", node, f"Input {handle} of node {node} is connected more than once", **edge)
+            connected[handle] = edge
+
+            if source in order and order.index(source) >= order.index(i) and parameters[handle][0] and handle not in widget_inputs:
+                error("unseeded_feedback", node, f"Input {handle} of node {node} is fed back from node {plan.ids[source]}, so it needs a value to start the cycle with", **edge)
+
+            if plan.fnames[source] not in registry:
+                continue # Reported on its own
+            output_types = registry[plan.fnames[source]].info.output_types
+            if not 0 <= source_handle < len(output_types):
+                error("unknown_output", node, f"Node {plan.ids[source]} has no output {source_handle}", **edge)
+            elif not compatible(output_types[source_handle], parameters[handle][1]):
+                error(
+                    "type_mismatch", node,
+                    f"Output {source_handle} of node {plan.ids[source]} is {output_types[source_handle]}, but input {handle} of node {node} takes {parameters[handle][1].get('type')}",
+                    **edge,
+                )
+
+        for name, value in widget_inputs.items():
+            if name not in parameters:
+                error("unknown_input", node, f"Node {node} has no input {name}", target_handle=name)
+                continue
+
+            info = parameters[name][1]
+            choices = info.get("choices")
+            default = "default" in info and value == info["default"] # A declared default is fine, listed or not
+            if choices is not None and name not in connected and value not in choices and not default:
+                error("invalid_choice", node, f"{value!r} is not a choice for input {name} of node {node}", target_handle=name, choices=list(choices))
+
+        for name, (required, _) in parameters.items():
+            if required and name not in connected and name not in widget_inputs:
+                error("missing_input", node, f"Node {node} is missing required input {name}", target_handle=name)
+
+        return errors
@@ -47,4 +47,75 @@ def basic_generator(
     
     for i in range(n):
         yield i
-        time.sleep(1)
\ No newline at end of file
+        time.sleep(1)
+
+@node
+def adds_numbers(
+    a: int,
+    b: int = 0
+) -> int:
+    return a + b
+
+@node
+def sleeps(
+    seconds: float = 0.1
+) -> float:
+    import time
+    time.sleep(seconds)
+    return seconds
+
+@node
+def counts_to(
+    n: int = 3
+) -> I[int]:
+    for i in range(n):
+        yield i
+
+@node
+def averages(
+    a: float = 0.0,
+    b: float = 0.0
+) -> float:
+    return (a + b) / 2
+
+@node(batchable=True)
+def multiplies(
+    a: int,
+    factor: int = 2
+) -> int:
+    return [x * f for x, f in zip(a, factor)]
+
+@node
+async def waits(
+    seconds: float = 0.1
+) -> float:
+    import asyncio
+    await asyncio.sleep(seconds)
+    return seconds
+
+@node
+async def ticks(
+    n: int = 3
+) -> AI[int]:
+    import asyncio
+    for i in range(n):
+        await asyncio.sleep(0.01)
+        yield i
+
+@node
+def picks_device(
+    device: Literal["cuda", "cpu"] = "" # Empty for automatic, like the loaders' override_device
+) -> str:
+    return device or "cpu"
+
+@node
+def worker_pid() -> int:
+    import os
+    return os.getpid()
+
+@node
+def makes_array(
+    n: int = 4
+) -> Any:
+    import numpy as np
+    return np.arange(n, dtype=np.float32)
@@ -1 +1,464 @@
-from . import nodes # Using test nodes to test executor
\ No newline at end of file
+import asyncio
+import pytest
+from types import SimpleNamespace
+
+from networkx import MultiDiGraph
+
+from sdbx import config
+from sdbx.executor import Executor
+from sdbx.plan import PlanCache, expand_sweep, apply_overrides
+from . import nodes # Using test nodes to test executor
+
+registry = { fn.__name__: fn for fn in vars(nodes).values() if hasattr(fn, 'info') }
+
+def make_flow(node_list, links):
+    """Build a flow graph like /prompt does from (id, fname, widget_inputs) and (source, target, source_handle, target_handle)."""
+    graph = MultiDiGraph()
+    for node_id, fname, widget_inputs in node_list:
+        graph.add_node(node_id, fname=fname, widget_inputs=widget_inputs)
+    for source, target, source_handle, target_handle in links:
+        graph.add_edge(source, target, source_handle=source_handle, target_handle=target_handle)
+    return graph
+
+async def run_flow(graph, executor=None, **kwargs):
+    executor = executor or Executor(SimpleNamespace(registry=registry))
+    executor.execute(graph, "test", **kwargs)
+    context = executor.tasks["test"]
+    await context.running_task
+
+    assert context.task_error is None
+    return context
+
+@pytest.fixture
+def keep_results(monkeypatch):
+    # Keep intermediate results around to look at them
+    monkeypatch.setattr(config.execution, "release_results", False)
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("max_concurrency", [1, 4])
+async def test_independent_branches(max_concurrency):
+    graph = make_flow(
+        [
+            ("a", "outputs_number", {"number": 1}),
+            ("b", "outputs_number", {"number": 2}),
+            ("c", "adds_numbers", {"b": 10}),
+            ("d", "adds_numbers", {"b": 20}),
+            ("e", "sleeps", {"seconds": 0.3}),
+            ("f", "sleeps", {"seconds": 0.31}), # Not identical, or they would be merged into one
+        ],
+        [("a", "c", 0, "a"), ("b", "d", 0, "a")],
+    )
+
+    loop = asyncio.get_running_loop()
+    start = loop.time()
+    context = await run_flow(graph, max_concurrency=max_concurrency)
+    elapsed = loop.time() - start
+
+    assert context.results["c"] == (11,)
+    assert context.results["d"] == (22,)
+    if max_concurrency > 1:
+        assert elapsed < 0.5 # Both sleepers ran at once
+    else:
+        assert elapsed >= 0.6
+
+@pytest.mark.asyncio
+async def test_blocking_nodes_run_off_loop():
+    graph = make_flow(
+        [("a", "sleeps", {"seconds": 0.3}), ("b", "sleeps", {"seconds": 0.31})], # Distinct, so they aren't merged into one
+        [],
+    )
+
+    ticks = 0
+    async def ticker():
+        nonlocal ticks
+        while True:
+            ticks += 1
+            await asyncio.sleep(0.01)
+
+    loop = asyncio.get_running_loop()
+    tick = asyncio.create_task(ticker())
+    start = loop.time()
+    context = await run_flow(graph)
+    elapsed = loop.time() - start
+    tick.cancel()
+
+    assert context.results["a"] == (0.3,)
+    assert elapsed < 0.55 # Both branches slept at the same time
+    assert ticks > 10 # The loop kept running meanwhile
+
+@pytest.mark.asyncio
+async def test_async_nodes_overlap_without_threads(keep_results):
+    # Far more waiting nodes than worker threads or concurrency slots; distinct delays so none get merged
+    graph = make_flow(
+        [(f"w{k}", "waits", {"seconds": 0.2 + k / 10000}) for k in range(100)] +
+        [("t", "ticks", {"n": 3}), ("add", "adds_numbers", {"b": 10})],
+        [("t", "add", 0, "a")],
+    )
+
+    loop = asyncio.get_running_loop()
+    start = loop.time()
+    context = await run_flow(graph, max_concurrency=1)
+
+    assert loop.time() - start < 1
+    assert context.results["w99"] == (0.2099,)
+    assert context.results["add"] == (12,) # Streamed from the async generator
+    assert context.profile.nodes["add"].calls == 3
+
+def test_plan_is_compiled_once_per_shape():
+    def flow(number):
+        return make_flow(
+            [("a", "outputs_number", {"number": number}), ("b", "adds_numbers", {})],
+            [("a", "b", 0, "a"), ("a", "b", 0, "b")],
+        )
+
+    plans = PlanCache()
+    plan = plans.compile(flow(1))
+
+    assert plans.compile(flow(2)) is plan # Widget values don't change the shape
+    assert plan.roots == [plan.unit_of[plan.index["a"]]]
+    assert list(plan.incoming(plan.index["b"])) == [0, 1]
+    assert sorted(h for h, _, _ in plan.inputs[plan.index["b"]]) == ["a", "b"]
+
+@pytest.mark.asyncio
+async def test_nodes_not_reaching_a_sink_are_pruned(keep_results):
+    graph = make_flow(
+        [
+            ("a", "outputs_number", {"number": 1}),
+            ("b", "adds_numbers", {"b": 1}),
+            ("c", "displays_number", {}),
+            ("loader", "outputs_number", {"number": 3}),
+            ("unused", "adds_numbers", {}),
+        ],
+        [("a", "b", 0, "a"), ("b", "c", 0, "number"), ("a", "unused", 0, "a"), ("loader", "unused", 0, "b")],
+    )
+
+    context = await run_flow(graph)
+
+    assert sorted(context.pruned) == ["loader", "unused"]
+    assert context.results["b"] == (2,)
+    assert "loader" not in context.results and "unused" not in context.results
+
+    # Without a sink there's nothing to go by, so everything runs
+    context = await run_flow(make_flow([("a", "outputs_number", {"number": 1})], []))
+    assert context.pruned == [] and context.results["a"] == (1,)
+
+@pytest.mark.asyncio
+async def test_identical_nodes_run_once(keep_results):
+    # Two copies of the same chain, plus a node that only differs in its settings
+    graph = make_flow(
+        [
+            ("a1", "outputs_number", {"number": 1}),
+            ("a2", "outputs_number", {"number": 1}),
+            ("b1", "adds_numbers", {"b": 1}),
+            ("b2", "adds_numbers", {"b": 1}),
+            ("b3", "adds_numbers", {"b": 2}),
+            ("c", "adds_numbers", {}),
+        ],
+        [("a1", "b1", 0, "a"), ("a2", "b2", 0, "a"), ("a2", "b3", 0, "a"), ("b1", "c", 0, "a"), ("b2", "c", 0, "b")],
+    )
+
+    context = await run_flow(graph)
+
+    assert context.merged == {"a2": "a1", "b2": "b1"}
+    assert context.profile.nodes["b2"].calls == 0
+    assert context.results["b2"] is context.results["b1"]
+    assert context.results["b3"] == (3,)
+    assert context.results["c"] == (4,)
+
+@pytest.mark.asyncio
+async def test_sweeps_run_batchable_nodes_in_one_call(keep_results):
+    graph = make_flow(
+        [("n", "outputs_number", {"number": 1}), ("m", "multiplies", {}), ("d", "displays_number", {})],
+        [("n", "m", 0, "a"), ("m", "d", 0, "number")],
+    )
+    graph = expand_sweep(graph, [{}, {"n": {"number": 2}}, {"n": {"number": 3}}, {"m": {"factor": 3}}])
+
+    context = await run_flow(graph)
+
+    assert [context.results[f"m#{k}"] for k in range(4)] == [(2,), (4,), (6,), (3,)]
+    assert context.merged["n#3"] == "n#0" # Identical parts of the copies run once
+    assert [context.profile.nodes[f"m#{k}"].batched for k in range(4)] == [4] * 4
+    assert sum(len(context.profile.nodes[f"m#{k}"].spans) for k in range(4)) == 1
+
+    # Outside a sweep it's a batch of one. Leftover widget values of connected inputs give way, batched or not
+    graph = make_flow([("n", "outputs_number", {"number": 5}), ("m", "multiplies", {"a": 100})], [("n", "m", 0, "a")])
+    context = await run_flow(graph)
+    assert context.results["m"] == (10,)
+
+    context = await run_flow(expand_sweep(graph, [{}, {"n": {"number": 6}}]))
+    assert [context.results[f"m#{k}"] for k in range(2)] == [(10,), (12,)]
+
+@pytest.mark.asyncio
+async def test_invalid_flows_fail_before_running():
+    graph = make_flow(
+        [
+            ("a", "sleeps", {"seconds": 0.1}),
+            ("b", "counts_to", {"n": 3}),
+            ("c", "adds_numbers", {"c": 1}),
+            ("d", "averages", {}),
+            ("e", "outputs_string", {}),
+            ("f", "adds_numbers", {}),
+        ],
+        [("a", "d", 0, "a"), ("b", "c", 2, "a"), ("b", "e", 0, "string"), ("d", "f", 0, "a")],
+    )
+
+    executor = Executor(SimpleNamespace(registry=registry))
+    errors = executor.validator.check(graph, executor.compile(graph))
+    assert sorted((error["code"], error["node"]) for error in errors) == [
+        ("type_mismatch", "e"),
+        ("type_mismatch", "f"),
+        ("unknown_input", "c"),
+        ("unknown_output", "c"),
+    ]
+    assert executor.validator.check(graph, executor.compile(graph)) is errors # Cached
+
+    executor.execute(graph, "test")
+    context = executor.tasks["test"]
+    await context.running_task
+
+    assert context.task_error.errors == errors
+    assert not context.results # Nothing ran
+
+def test_choices_accept_their_default():
+    executor = Executor(SimpleNamespace(registry=registry))
+
+    def check(device):
+        graph = make_flow([("p", "picks_device", {"device": device})], [])
+        return [error["code"] for error in executor.validator.check(graph, executor.compile(graph))]
+
+    assert check("") == [] # The declared default, though not a choice
+    assert check("cpu") == []
+    assert check("tpu") == ["invalid_choice"]
+
+def test_variants_only_recheck_overridden_nodes():
+    graph = make_flow([("n", "outputs_number", {"number": 1}), ("a", "adds_numbers", {"b": 2})], [("n", "a", 0, "a")])
+    executor = Executor(SimpleNamespace(registry=registry))
+    plan = executor.compile(graph)
+
+    checked = executor.validator.check_variants(graph, plan, [{}, { "a": { "b": 3 } }, { "a": { "c": 1 } }, { "x": {} }])
+    assert [[(error["code"], error["node"]) for error in errors] for errors in checked] == [
+        [], [], [("unknown_input", "a")], [("unknown_node", "x")],
+    ]
+
+    variant = apply_overrides(graph, { "a": { "b": 3 } })
+    assert variant.nodes["a"]["widget_inputs"] == { "b": 3 }
+    assert graph.nodes["a"]["widget_inputs"] == { "b": 2 } # The flow itself is untouched
+
+@pytest.mark.asyncio
+async def test_nodes_wait_for_every_input_edge(keep_results):
+    graph = make_flow(
+        [
+            ("a", "outputs_number", {"number": 1}),
+            ("b", "outputs_number", {"number": 2}),
+            ("c", "adds_numbers", {}),
+            ("d", "adds_numbers", {}),
+        ],
+        [("a", "c", 0, "a"), ("b", "c", 0, "b"), ("c", "d", 0, "a"), ("c", "d", 0, "b")],
+    )
+
+    context = await run_flow(graph)
+
+    assert context.results["c"] == (3,)
+    assert context.results["d"] == (6,)
+    assert list(context.remaining) == [0, 0, 0, 0]
+
+@pytest.mark.asyncio
+async def test_intermediate_results_are_released():
+    graph = make_flow(
+        [
+            ("a", "outputs_number", {"number": 1}),
+            ("b", "adds_numbers", {"b": 1}),
+            ("c", "adds_numbers", {}),
+            ("d", "displays_number", {}),
+        ],
+        [("a", "b", 0, "a"), ("b", "c", 0, "a"), ("a", "c", 0, "b"), ("c", "d", 0, "number")],
+    )
+
+    executor = Executor(SimpleNamespace(registry=registry))
+    context = await run_flow(graph, executor)
+
+    assert dict(context.results) == {"d": (None,)} # Only what the client is shown
+    assert list(context.consumers) == [0, 0, 0, 0]
+
+    # Released results are still kept for the next run to reuse
+    assert set(context.kept) == {"a", "b", "c"}
+    first, context = context, await run_flow(graph, executor)
+    assert context.reused == {"a", "b", "c", "d"}
+    assert context.profile.nodes["a"].calls == 0
+    assert not first.kept # Only the latest run is kept for reuse
+
+@pytest.mark.asyncio
+async def test_resubmitted_flow_only_reruns_changed_nodes(keep_results):
+    def flow(b):
+        return make_flow(
+            [
+                ("a", "outputs_number", {"number": 1}),
+                ("b", "outputs_number", {"number": b}),
+                ("c", "adds_numbers", {}),
+                ("d", "adds_numbers", {"b": 5}),
+            ],
+            [("a", "c", 0, "a"), ("b", "c", 0, "b"), ("a", "d", 0, "a")],
+        )
+
+    executor = Executor(SimpleNamespace(registry=registry))
+    await run_flow(flow(2), executor)
+    context = await run_flow(flow(3), executor)
+
+    assert context.reused == {"a", "d"}
+    assert context.results["c"] == (4,)
+    assert context.results["d"] == (6,)
+
+@pytest.mark.asyncio
+async def test_resubmitted_streams_replay_every_item():
+    def flow(b):
+        return make_flow(
+            [("gen", "counts_to", {"n": 3}), ("add", "adds_numbers", {"b": b}), ("show", "displays_number", {})],
+            [("gen", "add", 0, "a"), ("add", "show", 0, "number")],
+        )
+
+    executor = Executor(SimpleNamespace(registry=registry))
+    await run_flow(flow(10), executor)
+    context = await run_flow(flow(20), executor) # Only the consumer changed
+
+    assert "gen" not in context.reused # Its last item alone would be all the consumer got
+    assert context.profile.nodes["add"].calls == 3
+    assert context.profile.nodes["show"].calls == 3
+
+@pytest.mark.asyncio
+async def test_generator_results_stream_to_consumers(keep_results):
+    graph = make_flow(
+        [
+            ("gen", "counts_to", {"n": 3}),
+            ("add", "adds_numbers", {"b": 100}),
+            ("sum", "adds_numbers", {}),
+        ],
+        [("gen", "add", 0, "a"), ("add", "sum", 0, "a"), ("gen", "sum", 0, "b")],
+    )
+
+    seen = []
+    async def observe(context):
+        # A slow observer must not hold back execution
+        async for message in context.bus.subscribe():
+            seen.append(message)
+            await asyncio.sleep(1)
+
+    executor = Executor(SimpleNamespace(registry=registry))
+    executor.execute(graph, "test", max_concurrency=1)
+    context = executor.tasks["test"]
+    watcher = asyncio.create_task(observe(context))
+    await asyncio.wait_for(context.running_task, 2)
+    watcher.cancel()
+
+    assert context.completion_event.is_set()
+    assert context.results["add"] == (102,) # Last item: 2 + 100
+    assert context.results["sum"] == (104,) # Streams are zipped: (2 + 100) + 2
+    assert len(seen) == 1
+    assert context.bus.ring[-1]["type"] == "completed"
+    assert context.versions["sum"] == max(m["seq"] for m in context.bus.ring if m.get("node") == "sum") # Its latest result
+
+@pytest.mark.asyncio
+async def test_consumers_run_while_long_generators_yield(keep_results):
+    n = config.execution.stream_buffer * 3 # More items than an edge buffer holds
+    graph = make_flow([("gen", "counts_to", {"n": n}), ("add", "adds_numbers", {"b": 1})], [("gen", "add", 0, "a")])
+
+    executor = Executor(SimpleNamespace(registry=registry))
+    executor.execute(graph, "test")
+    context = executor.tasks["test"]
+    await asyncio.wait_for(context.running_task, 2)
+
+    assert context.results["add"] == (n,)
+    profile = context.profile.nodes
+    assert profile["add"].calls == n
+    assert profile["add"].spans[0][0] < profile["gen"].spans[-1][0] # Started before the generator was done
+
+@pytest.mark.asyncio
+async def test_cycles_iterate_until_they_converge(keep_results):
+    # a and b feed each other; a settles on the average of itself and 2, so both converge to 2
+    graph = make_flow(
+        [
+            ("a", "averages", {"b": 2.0}),
+            ("b", "averages", {}),
+            ("c", "averages", {"b": 4.0}),
+            ("d", "outputs_number", {"number": 5}),
+        ],
+        [("a", "b", 0, "a"), ("a", "b", 0, "b"), ("b", "a", 0, "a"), ("b", "c", 0, "a")],
+    )
+
+    plan = PlanCache().compile(graph)
+    assert plan.cyclic[plan.unit_of[plan.index["a"]]]
+    assert plan.unit_of[plan.index["a"]] == plan.unit_of[plan.index["b"]]
+    assert len(plan.roots) == 2 # The cycle and d
+
+    context = await run_flow(graph)
+
+    assert context.results["a"][0] == pytest.approx(2, abs=1e-5)
+    assert context.results["c"][0] == pytest.approx(3, abs=1e-5)
+    assert context.results["d"] == (5,)
+
+@pytest.mark.asyncio
+async def test_required_feedback_needs_a_starting_value(keep_results):
+    # x = y + 1 and y = x - 1 hold for any x, but x runs first, before y has fed anything back
+    def flow(seed):
+        return make_flow(
+            [("x", "adds_numbers", {"b": 1, **seed}), ("y", "adds_numbers", {"b": -1})],
+            [("y", "x", 0, "a"), ("x", "y", 0, "a")],
+        )
+
+    executor = Executor(SimpleNamespace(registry=registry))
+    errors = executor.validator.check(flow({}), executor.compile(flow({})))
+    assert [(error["code"], error["node"], error["target_handle"]) for error in errors] == [("unseeded_feedback", "x", "a")]
+
+    context = await run_flow(flow({"a": 0}), executor) # The widget value starts the cycle, feedback replaces it
+    assert context.results["x"] == (1,) and context.results["y"] == (0,)
+
+@pytest.mark.asyncio
+async def test_nodes_are_profiled():
+    graph = make_flow(
+        [("a", "sleeps", {"seconds": 0.1}), ("b", "counts_to", {"n": 3}), ("c", "adds_numbers", {"b": 1})],
+        [("b", "c", 0, "a")],
+    )
+
+    context = await run_flow(graph)
+    profile = context.profile.nodes
+
+    assert profile["a"].calls == 1
+    assert profile["a"].wall >= 0.1
+    assert profile["a"].cpu < profile["a"].wall # Sleeping isn't working
+    assert profile["b"].yields == 3
+    assert profile["c"].calls == 3 # Once per streamed item
+    assert profile["c"].output_size > 0
+
+    report = context.profile.dict()
+    assert report["nodes"][0]["node"] == "a" # Hottest first
+
+    spans = [e for e in context.profile.trace()["traceEvents"] if e["ph"] == "X"]
+    assert len(spans) == 1 + 4 + 3 # One step per yield, plus the one that finds the generator exhausted
+
+    status = context.dict()
+    assert status["state"] == "completed" and status["error"] is None
+    assert status["progress"] == { "nodes": 3, "done": 3 }
+    assert status["nodes"]["b"]["yields"] == 3 and status["nodes"]["c"]["version"] == context.versions["c"]
+
+@pytest.mark.asyncio
+async def test_bus_replays_to_late_and_slow_subscribers():
+    from sdbx.bus import ResultBus
+
+    bus = ResultBus(size=3)
+    for n in range(5):
+        bus.publish("result", node=str(n))
+
+    late = [m async for m in _take(bus.subscribe(), 4)]
+    assert [m["type"] for m in late] == ["gap", "result", "result", "result"]
+    assert late[0]["missed"] == 2
+    assert [m["seq"] for m in late[1:]] == [3, 4, 5]
+
+    caught_up = bus.subscribe(since=5)
+    bus.publish("completed")
+    assert [m["type"] async for m in caught_up] == ["completed"]
+
+async def _take(subscription, count):
+    async for message in subscription:
+        yield message
+        count -= 1
+        if not count:
+            return
@@ -0,0 +1,116 @@
+import pytest
+import numpy as np
+
+from sdbx.nodes.helpers import ResultCache, GeneratorCache, estimate_size
+
+def test_result_cache_hits_and_identity_keys():
+    store = ResultCache(budget=1024 ** 2)
+    calls = []
+
+    @store
+    def doubles(value):
+        calls.append(value)
+        return value * 2
+
+    array = np.ones(4)
+
+    assert doubles(2) == 4 and doubles(2) == 4
+    assert (doubles(array) == 2).all() and (doubles(array) == 2).all() # Unhashable inputs are keyed by identity
+    doubles(np.ones(4)) # An equal but distinct array is a different input
+
+    assert len(calls) == 3
+    assert store.stats()["hits"] == 2
+    assert store.stats()["misses"] == 3
+
+def test_result_cache_evicts_within_budget():
+    store = ResultCache(budget=3 * 800, policy="lfu")
+    make = store(lambda n: np.zeros(100)) # 800 bytes each
+
+    make(0); make(0); make(1); make(2)
+    make(3) # Evicts the least used entry, 1
+
+    assert store.size <= store.budget
+    assert store.evictions == 1
+    assert store.get((make.__module__, make.__qualname__, ("tuple", 1), ("list",)))[0] is False
+    assert store.get((make.__module__, make.__qualname__, ("tuple", 0), ("list",)))[0] is True
+
+def test_result_cache_counts_pinned_inputs():
+    store = ResultCache(budget=2 * 800)
+    total = store(lambda array: float(array.sum())) # Tiny result, but the 800 byte input is pinned
+
+    for _ in range(4):
+        total(np.zeros(100)) # Fresh arrays always miss
+
+    assert store.size <= store.budget
+    assert store.stats()["entries"] < 4
+
+def test_generator_cache_stays_within_budget():
+    streams = GeneratorCache(budget=3 * 800)
+
+    @streams
+    def arrays(n, seed):
+        for _ in range(n):
+            yield np.zeros(100) # 800 bytes each
+
+    assert len(list(arrays(2, 0))) == 2
+    assert streams.stats()["size"] >= 1600
+
+    assert len(list(arrays(2, 1))) == 2 # Pushes out the first run
+    assert streams.stats()["entries"] == 1 and streams.bytes <= streams.budget
+
+    assert len(list(arrays(5, 2))) == 5 # Too big to keep at all, but still complete
+    assert not streams.entries and streams.bytes == 0
+
+def test_estimate_size():
+    assert estimate_size(np.zeros(10, dtype=np.float32)) == 40
+    assert estimate_size((np.zeros(10), np.zeros(10))) >= 160
+
+def test_generator_cache_replays_while_producing():
+    streams = GeneratorCache(size=2)
+    produced = []
+
+    @streams
+    def counts(n):
+        for i in range(n):
+            produced.append(i)
+            yield i
+
+    first = counts(3)
+    assert next(first) == 0
+
+    second = counts(3) # Joins mid-run: replays 0, then shares the live producer
+    assert list(second) == [0, 1, 2]
+    assert list(first) == [1, 2]
+    assert list(counts(3)) == [0, 1, 2]
+
+    assert produced == [0, 1, 2]
+    assert streams.stats()["hits"] == 2
+
+    counts(4); counts(5) # Bounded to the two most recent runs
+    assert streams.stats()["evictions"] == 1
+
+@pytest.mark.asyncio
+async def test_caches_await_async_nodes():
+    store, streams = ResultCache(budget=1024 ** 2), GeneratorCache()
+    calls, produced = [], []
+
+    @store
+    async def doubles(x):
+        calls.append(x)
+        return x * 2
+
+    @streams
+    async def counts(n):
+        for i in range(n):
+            produced.append(i)
+            yield i
+
+    assert await doubles(2) == 4
+    assert await doubles(2) == 4
+    assert calls == [2]
+
+    first = counts(3)
+    assert await anext(first) == 0
+    assert [i async for i in counts(3)] == [0, 1, 2] # Replays, then shares the live producer
+    assert [i async for i in first] == [1, 2]
+    assert produced == [0, 1, 2]
@@ -0,0 +1,50 @@
+import os
+import sys
+import numpy as np
+from concurrent.futures import ThreadPoolExecutor
+from multiprocessing.shared_memory import SharedMemory
+
+import pytest
+
+from sdbx.isolation import IsolatedPool, Shared, share, unshare
+from . import nodes
+
+def test_arrays_travel_through_shared_memory():
+    array = np.arange(12, dtype=np.float32).reshape(3, 4)
+
+    shared = share({ "a": array, "b": [array, "text"] })
+    assert isinstance(shared["a"], Shared) and shared["b"][1] == "text"
+
+    values = unshare(shared)
+    assert np.array_equal(values["a"], array)
+    assert values["a"].base is not array # A view of the block, not the original
+
+    with pytest.raises(FileNotFoundError):
+        SharedMemory(shared["a"].name) # Unlinked once received
+
+def test_isolated_nodes_keep_their_info():
+    # Threads stand in for the worker processes, which would need the server's own command line
+    pool = IsolatedPool(executor=ThreadPoolExecutor(1))
+
+    adds = pool.wrap(nodes.adds_numbers)
+    assert adds.info is nodes.adds_numbers.info and adds.isolated
+    assert adds(a=1, b=2) == 3
+
+    counts = pool.wrap(nodes.counts_to)
+    assert list(counts(n=3)) == [0, 1, 2]
+
+def test_isolated_nodes_run_in_recycled_worker_processes(monkeypatch):
+    monkeypatch.setenv("SDBX_WORKER", "1") # Workers only need the nodes, not the server app
+    monkeypatch.setattr(sys, "argv", sys.argv[:1]) # Spawned workers parse it again when importing sdbx
+    pool = IsolatedPool(python=sys.executable, workers=1, max_tasks=2)
+    try:
+        pid = pool.wrap(nodes.worker_pid)
+        pids = [pid() for _ in range(3)]
+        assert os.getpid() not in pids
+        assert pids[0] == pids[1] != pids[2] # Replaced after two calls
+
+        array = pool.wrap(nodes.makes_array)(n=1000)
+        assert np.array_equal(array, np.arange(1000, dtype=np.float32))
+        assert not array.flags.owndata # A view of the worker's shared memory block, not a pickled copy
+    finally:
+        pool.executor.shutdown()
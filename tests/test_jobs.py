@@ -0,0 +1,78 @@
+import asyncio
+import pytest
+from types import SimpleNamespace
+
+from sdbx.executor import Executor
+from sdbx.jobs import JobScheduler
+from .test_executor import make_flow, registry
+
+@pytest.fixture
+def flow():
+    return make_flow([("a", "sleeps", {"seconds": 0.05})], [])
+
+def make_scheduler(**kwargs):
+    return JobScheduler(Executor(SimpleNamespace(registry=registry)), max_concurrent=1, **kwargs)
+
+async def cancel_all(scheduler):
+    for tid in list(scheduler.executor.tasks):
+        scheduler.cancel(tid)
+
+    tasks = [c.running_task for c in scheduler.executor.tasks.values() if c.running_task]
+    await asyncio.gather(*tasks, return_exceptions=True)
+
+@pytest.mark.asyncio
+async def test_priority_and_client_fairness(flow):
+    scheduler = make_scheduler(preemption=False)
+
+    for tid, client in [("x1", "x"), ("x2", "x"), ("y1", "y")]:
+        scheduler.submit(flow, tid, client=client)
+    scheduler.submit(flow, "urgent", priority=1, client="z")
+
+    assert scheduler.position("x1") == 0 # Running
+    assert scheduler.positions() == {"urgent": 1, "y1": 2, "x2": 3}
+
+    scheduler.cancel("y1")
+    assert scheduler.positions() == {"urgent": 1, "x2": 2}
+    assert scheduler.executor.tasks["y1"].state == "cancelled"
+
+    await cancel_all(scheduler)
+
+@pytest.mark.asyncio
+async def test_preemption_pauses_lower_priority(flow):
+    scheduler = make_scheduler(preemption=True)
+
+    low = scheduler.submit(flow, "low")
+    high = scheduler.submit(flow, "high", priority=5)
+
+    assert high.context.state == "running"
+    assert low.context.state == "paused"
+    assert scheduler.position("low") == 1
+
+    await cancel_all(scheduler)
+    assert not scheduler.jobs and not scheduler.running
+
+@pytest.mark.asyncio
+async def test_job_finishing_while_paused_leaves_the_queue():
+    scheduler = make_scheduler(preemption=True)
+
+    low = scheduler.submit(make_flow([("a", "sleeps", {"seconds": 0.3})], []), "low")
+    await asyncio.sleep(0.1)
+    high = scheduler.submit(make_flow([("a", "sleeps", {"seconds": 0.4})], []), "high", priority=5) # Outlasts low
+    assert low.context.state == "paused" # Its node is still running, and there's no safe point after it
+
+    await asyncio.gather(low.context.running_task, high.context.running_task)
+    assert low.context.state == "completed" and high.context.state == "completed"
+    assert not scheduler.running and not scheduler.waiting
+
+    last = scheduler.submit(make_flow([("a", "sleeps", {"seconds": 0.01})], []), "last")
+    assert last.context.state == "running"
+    await last.context.running_task
+
+@pytest.mark.asyncio
+async def test_jobs_take_their_own_concurrency_limit(flow):
+    scheduler = make_scheduler(preemption=False)
+
+    job = scheduler.submit(flow, "narrow", max_concurrency=1)
+    assert job.context.semaphore._value == 1
+
+    await cancel_all(scheduler)
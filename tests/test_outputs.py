@@ -0,0 +1,42 @@
+import os
+import pytest
+
+from PIL import Image
+
+from sdbx.server.outputs import OutputStore
+
+@pytest.mark.asyncio
+async def test_outputs_write_latest_version_and_reference_it(tmp_path):
+    outputs = OutputStore(str(tmp_path), format="png")
+    red, blue = Image.new("RGB", (4, 4), "red"), Image.new("RGB", (2, 2), "blue")
+
+    referenced = await outputs.references("t", { "n#1": (red, [blue], 3), "text": ("x",) }, { "n#1": 5, "text": 6 })
+
+    assert referenced["text"] == ("x",)
+    assert referenced["n#1"][0] == { "url": "/outputs/t/n%231/0?v=5", "mime": "image/png" }
+    assert referenced["n#1"][1][0]["url"] == "/outputs/t/n%231/1?v=5"
+    assert Image.open(outputs.path("t", "n#1", 1)).size == (2, 2)
+
+    await outputs.references("t", { "n#1": (blue,) }, { "n#1": 7 })
+    assert outputs.path("t", "n#1", 0) == outputs.path("t", "n#1", 0, 7)
+    assert not os.path.exists(outputs.path("t", "n#1", 0, 5)) # Superseded
+
+    with pytest.raises(ValueError):
+        outputs.path("..", "n", 0)
+
+def test_outputs_tolerate_concurrent_writers_and_forget_old_tasks(tmp_path):
+    from concurrent.futures import ThreadPoolExecutor
+
+    outputs = OutputStore(str(tmp_path), format="png", tasks={ "t": None })
+    result = (Image.new("RGB", (64, 64), "red"),)
+
+    with ThreadPoolExecutor(4) as pool:
+        for future in [pool.submit(outputs.write, "t", "n", 1, result) for _ in range(8)]:
+            future.result() # Nobody fails for losing the race
+
+    assert os.listdir(os.path.join(tmp_path, "t", "n")) == ["1"]
+
+    outputs.write("old", "n", 1, result)
+    outputs.tasks = { "new": None } # "t" and "old" were retired
+    outputs.write("new", "n", 1, result, outputs.live())
+    assert os.listdir(tmp_path) == ["new"]
@@ -0,0 +1,39 @@
+import io
+import json
+import pytest
+
+from PIL import Image
+
+from sdbx.server.serialize import BinaryResults, ResultPayloads
+
+@pytest.mark.asyncio
+async def test_binary_results_split_images_into_frames():
+    red, blue = Image.new("RGBA", (4, 4), "red"), Image.new("RGB", (2, 2), "blue")
+    binary = BinaryResults(format="jpeg", quality=80)
+
+    header, frames = await binary.split({ "a": (red, 1), "b": ([blue], "text") }, { "a": 1, "b": 2 })
+
+    assert header["a"][1] == 1 and header["b"][1] == "text"
+    assert header["a"][0] == { "frame": 0, "mime": "image/jpeg", "size": len(frames[0]) }
+    assert header["b"][0][0]["frame"] == 1
+    assert [Image.open(io.BytesIO(f)).format for f in frames] == ["JPEG", "JPEG"]
+    assert Image.open(io.BytesIO(frames[1])).size == (2, 2)
+
+    again, reframed = await binary.split({ "a": (red, 1) }, { "a": 1 }) # A version's images aren't encoded again
+    assert reframed[0] is frames[0]
+
+    assert binary.encoded["a"] == (1, [frames[0]]) # Only the bytes are kept
+    _, changed = await binary.split({ "a": (blue, 1) }, { "a": 3 })
+    assert changed[0] is not frames[0] and Image.open(io.BytesIO(changed[0])).size == (2, 2)
+
+def test_result_payloads_serialize_each_version_once():
+    payloads = ResultPayloads()
+    results = { "a": (1, "x"), 2: ([3],) }
+
+    text = payloads.message({ "seq": 4 }, results, { "a": 1, 2: 4 })
+    assert json.loads(text) == { "seq": 4, "results": { "a": [1, "x"], "2": [[3]] } }
+
+    first = payloads.payloads["a"][1]
+    payloads.message({}, { "a": (1, "x") }, { "a": 1 })
+    assert payloads.payloads["a"][1] is first
+    assert json.loads(payloads.message({}, { "a": (5,) }, { "a": 6 })) == { "results": { "a": [5] } }
@@ -0,0 +1,51 @@
+import os
+import gc
+import pytest
+import numpy as np
+from types import SimpleNamespace
+
+from sdbx.spill import Results, Spilled, SpillStore
+
+@pytest.mark.asyncio
+async def test_spilled_results_map_back(tmp_path):
+    array = np.arange(100_000, dtype=np.float32)
+    context = SimpleNamespace(results=Results())
+    context.results["a"] = (array, "label")
+
+    spills = SpillStore(str(tmp_path), watermark=1) # Always above it
+    spills.check([context])
+    await spills.spilling
+
+    raw = dict.__getitem__(context.results, "a")
+    assert isinstance(raw[0], Spilled) and raw[1] == "label" # Only arrays and tensors go to disk
+    assert len(os.listdir(tmp_path)) == 1
+
+    value = context.results["a"][0]
+    assert isinstance(value, np.memmap)
+    assert np.array_equal(value, array)
+    value[0] = 5 # Copy-on-write, the file stays as it was
+
+    del raw
+    gc.collect()
+    assert not os.listdir(tmp_path) # Removed with its stand-in, while still mapped
+
+    spills.check([context])
+    assert spills.spilling is None # Mapped back values aren't written out again
+
+@pytest.mark.asyncio
+async def test_spilled_results_leave_the_result_cache(tmp_path):
+    from sdbx.nodes.helpers import ResultCache
+
+    cache = ResultCache(budget=1024 ** 2)
+    make = cache(lambda n: np.ones(n))
+    kept = cache(lambda n: np.zeros(n))
+    context = SimpleNamespace(results=Results())
+    context.results["a"] = (make(1000),)
+    kept(10)
+
+    spills = SpillStore(str(tmp_path), watermark=1, caches=[cache])
+    spills.check([context])
+    await spills.spilling
+
+    assert cache.stats()["entries"] == 1 # Only the spilled array's entry is gone
+    assert cache.size == cache.entries[next(iter(cache.entries))][1]